@@ -27,22 +27,28 @@
 import configparser
 import csv
 import datetime
+import hashlib
+import json
+import multiprocessing
 import os
 import platform
 import sys
+import time
 from collections import OrderedDict
 from contextlib import contextmanager
 from functools import wraps
 
 # Fabric imports
-from fabric.api import env, prefix
+from fabric.api import env, execute, prefix
 from fabric.colors import red, green, blue, yellow
-from fabric.decorators import task
+from fabric.decorators import runs_once, task
 from fabric.operations import get, hide, local as _local, \
     run as _run, sudo as _sudo, reboot, put
 from fabric.context_managers import cd, settings
 from fabric.contrib import django
 from fabric.contrib.files import exists, upload_template
+from fabric.network import disconnect_all
+from fabric.state import connections
 from fabtools.postgres import (create_database,
                                create_user as create_pg_user,
                                database_exists,
@@ -107,15 +113,57 @@ if 'localhost' not in env.hosts:
 
 REBOOT_TIME = 300
 
+# nltk packages and their unpacked locations inside NLTK_DATA
+NLTK_PACKAGES = OrderedDict((
+    ('averaged_perceptron_tagger', 'taggers/averaged_perceptron_tagger'),
+    ('punkt', 'tokenizers/punkt'),
+    ('stopwords', 'corpora/stopwords'),
+    ('words', 'corpora/words'),
+    ('maxent_ne_chunker', 'chunkers/maxent_ne_chunker'),
+    ('wordnet', 'corpora/wordnet'),
+))
+
+STANFORD_VERSION = '2017-06-09'
+STANFORD_URLS = [
+    'https://nlp.stanford.edu/software/stanford-corenlp-full-{}.zip',
+    'https://nlp.stanford.edu/software/stanford-parser-full-{}.zip',
+    'https://nlp.stanford.edu/software/stanford-english-corenlp-{}-models.jar',
+    'https://nlp.stanford.edu/software/stanford-postagger-full-{}.zip',
+    'https://nlp.stanford.edu/software/stanford-ner-{}.zip',
+]
+
+
+def set_install_dir(install_dir):
+    """
+    Set project and virtualenv paths inside given dir: base dir, current release or a new release.
+    """
+    env.project_dir = os.path.join(install_dir, env.project_path)
+    env.repo_dir = os.path.normpath(os.path.join(env.project_dir, '..'))
+    env.deployed_state_file = os.path.join(env.repo_dir, '.git', 'DEPLOYED_HEAD')
+    env.virtualenv_dir = os.path.join(install_dir, env.ve_dir)
+    env.ve_bin = os.path.join(env.virtualenv_dir, 'bin')
+    env.python_bin = os.path.join(env.ve_bin, 'python')
+    env.pip_bin = os.path.join(env.ve_bin, 'pip')
+    env.uwsgi_bin = os.path.join(env.ve_bin, 'uwsgi')
+    env.manage_py = os.path.join(env.project_dir, 'manage.py')
+
+
 # Path configuration parameters
-env.project_dir = os.path.join(env.base_dir, env.project_path)
-env.virtualenv_dir = os.path.join(env.base_dir, env.ve_dir)
-env.ve_bin = os.path.join(env.virtualenv_dir, 'bin')
-env.python_bin = os.path.join(env.ve_bin, 'python')
-env.pip_bin = os.path.join(env.ve_bin, 'pip')
-env.uwsgi_bin = os.path.join(env.ve_bin, 'uwsgi')
-env.manage_py = os.path.join(env.project_dir, 'manage.py')
+if env.get('use_releases'):
+    # releases layout: services run from current release symlink
+    env.releases_dir = os.path.join(env.base_dir, 'releases')
+    env.shared_dir = os.path.join(env.base_dir, 'shared')
+    env.current_dir = os.path.join(env.base_dir, 'current')
+    env.install_dir = env.current_dir
+else:
+    env.install_dir = env.base_dir
+set_install_dir(env.install_dir)
+env.provision_state_file = '~/.%s_provisioned' % env.templates_prefix
 env.uwsgi_name = '%s_uwsgi' % env.templates_prefix
+# celery multi pidfiles outside of release dirs, so restart after a release switch finds running workers
+env.celery_pid_dir = '/run/celery-%s' % env.templates_prefix
+env.nltk_data_dir = os.path.join(env.base_dir, env.nltk_data_path)
+env.upload_temp_dir = os.path.join(env.base_dir, env.upload_temp_path)
 
 """
 Get local django settings
@@ -142,6 +190,18 @@ except ImportError:
     LOG_FILE_PATH = os.path.join(env.project_dir, 'logs/django-{0}.log'.format(platform.node()))
     DB_LOG_FILE_PATH = os.path.join(env.project_dir, 'logs/db-{0}.log'.format(platform.node()))
 
+# log files rotated by logrotate, besides logs dir
+env.uwsgi_log_file = '/var/log/uwsgi/%s.log' % env.templates_prefix
+env.app_log_files = [path for path in (LOG_FILE_PATH, CELERY_LOG_FILE_PATH, DB_LOG_FILE_PATH)
+                     if os.path.dirname(path) != os.path.join(env.project_dir, 'logs')]
+if env.get('log_ship_target'):
+    env.log_ship_host, env.log_ship_port = env.log_ship_target.rsplit(':', 1)
+
+# internal nginx location for X-Accel-Redirect documents serving
+env.protected_documents_root = os.path.join(MEDIA_ROOT, FILEBROWSER_DIRECTORY, '')
+# the same documents under public /media location
+env.protected_documents_media_url = '/media/{}/'.format(FILEBROWSER_DIRECTORY.strip('/'))
+
 templates = OrderedDict((
     ('run', {
         'local_path': 'templates/run.sh',
@@ -171,7 +231,68 @@ templates = OrderedDict((
         'reload_command': 'systemctl restart nginx',
         'use_jinja': 'true',
     }),
+    ('logrotate', {
+        'local_path': 'templates/logrotate.conf',
+        'remote_path': '/etc/logrotate.d/%s' % env.templates_prefix,
+        'mode': '644',
+        'use_jinja': 'true',
+    }),
+    ('logrotate-cron', {
+        'local_path': 'templates/logrotate-cron.sh',
+        'remote_path': '/etc/cron.hourly/%s-logrotate' % env.templates_prefix,
+        'mode': '755',
+    }),
+    ('rsyslog', {
+        'local_path': 'templates/rsyslog.conf',
+        'remote_path': '/etc/rsyslog.d/60-%s.conf' % env.templates_prefix,
+        'reload_command': 'systemctl restart rsyslog',
+        'use_jinja': 'true',
+        'optional': 'true',
+    }),
+    ('rabbitmq', {
+        'local_path': 'templates/rabbitmq.conf',
+        'remote_path': '/etc/rabbitmq/rabbitmq.conf',
+        'reload_command': 'systemctl restart rabbitmq-server',
+        'use_jinja': 'true',
+        'optional': 'true',
+    }),
+    ('rabbitmq-legacy', {
+        'local_path': 'templates/rabbitmq.config',
+        'remote_path': '/etc/rabbitmq/rabbitmq.config',
+        'reload_command': 'systemctl restart rabbitmq-server',
+        'use_jinja': 'true',
+        'optional': 'true',
+    }),
+    ('sysctl', {
+        'local_path': 'templates/sysctl.conf',
+        'remote_path': '/etc/sysctl.d/60-%s.conf' % env.templates_prefix,
+        'reload_command': 'sysctl -p /etc/sysctl.d/60-%s.conf' % env.templates_prefix,
+        'optional': 'true',
+    }),
+    ('limits', {
+        'local_path': 'templates/limits.conf',
+        'remote_path': '/etc/security/limits.d/%s.conf' % env.templates_prefix,
+        'optional': 'true',
+    }),
+    ('thp', {
+        'local_path': 'templates/disable-thp.service',
+        'remote_path': '/etc/systemd/system/disable-thp.service',
+        'reload_command': 'systemctl daemon-reload && systemctl enable disable-thp && systemctl start disable-thp',
+        'optional': 'true',
+    }),
+))
+
+# kernel settings and services managed by tune_host
+TUNED_SYSCTL = OrderedDict((
+    ('net.core.somaxconn', 'sysctl_somaxconn'),
+    ('net.ipv4.tcp_max_syn_backlog', 'sysctl_somaxconn'),
+    ('vm.overcommit_memory', 'sysctl_overcommit_memory'),
+    ('vm.swappiness', 'sysctl_swappiness'),
+    ('vm.max_map_count', 'sysctl_max_map_count'),
+    ('fs.file-max', 'sysctl_file_max'),
 ))
+# postgresql@ is the template of cluster units (postgresql@9.5-main), postgresql.service is a wrapper
+TUNED_SERVICES = ('nginx', env.uwsgi_name, 'redis_6379', 'elasticsearch', 'postgresql@', 'rabbitmq-server')
 
 """
 --------------------------------
@@ -201,6 +322,71 @@ def log_call(func):
     return logged
 
 
+"""
+--------------------------------
+Host facts
+--------------------------------
+"""
+
+
+def get_host_facts_cache_path():
+    host = (env.host_string or 'localhost').replace('@', '_').replace(':', '_')
+    return os.path.join(env.config_dir, '.facts', '{}.json'.format(host))
+
+
+def get_host_facts(refresh=False):
+    """
+    Return facts about the host: os, kernel, init, reboot_required, cpu_count,
+    memory, disk, apt and pip packages, service units states.
+    Facts are collected in a single remote call and cached locally per host
+    for facts_ttl seconds.
+    """
+    cache_path = get_host_facts_cache_path()
+    if not refresh:
+        # cache may be replaced or removed concurrently by parallel provisioning steps
+        try:
+            if time.time() - os.path.getmtime(cache_path) < int(env.facts_ttl):
+                with open(cache_path) as f:
+                    return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    script_path = put_script('host_facts.py')
+    with hide('stdout'):
+        ret = run_check('python3 {} {} {}'.format(script_path, env.python_bin, env.base_dir),
+                        use_sudo=True, combine_stderr=False)
+    remove_script(script_path)
+    facts = json.loads([line for line in ret.splitlines() if line.startswith('{')][-1])
+
+    if not os.path.exists(os.path.dirname(cache_path)):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # write to a temp file and replace, so readers never see a partial cache
+    temp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(temp_path, 'w') as f:
+        json.dump(facts, f)
+    os.replace(temp_path, cache_path)
+    return facts
+
+
+def invalidate_host_facts():
+    """
+    Drop cached host facts after changes on the host.
+    """
+    try:
+        os.remove(get_host_facts_cache_path())
+    except FileNotFoundError:
+        pass
+
+
+@task
+def facts(name=None, refresh=False):
+    """
+    Output host facts or given fact, e.g. facts:memory
+    """
+    host_facts = get_host_facts(refresh=refresh)
+    print(json.dumps(host_facts[name] if name else host_facts, indent=2, sort_keys=True))
+
+
 """
 --------------------------------
 Installers methods
@@ -230,6 +416,18 @@ def upload_template_and_reload(template_name):
     owner = template.get('owner')
     mode = template.get('mode')
     template_dir = template.get('template_dir', '.')
+    if template_name in ('nginx', 'settings'):
+        # nodes installed before these dirs were added don't have them, nginx would fail to reload
+        create_template_dirs()
+    if env.get('use_releases'):
+        # shared paths of a release are symlinks: render to the shared copy linked by every release,
+        # sudo mv of the upload would replace the symlink with a file of this release only
+        relative_path = os.path.relpath(remote_path, env.project_dir)
+        if relative_path in get_shared_paths():
+            remote_path = os.path.join(env.shared_dir, relative_path)
+    if template.get('use_jinja'):
+        # host facts are available in jinja templates as {{ facts.cpu_count }}, etc.
+        env.facts = get_host_facts()
     upload_template(local_path, remote_path, env, use_sudo=True, backup=False,
                     template_dir=template_dir, use_jinja=template.get('use_jinja'))
     if owner:
@@ -244,9 +442,11 @@ def upload_template_and_reload(template_name):
 @log_call
 def upload_templates(template_names=None):
     """
-    Upload given templates
+    Upload given templates, by default all but optional ones
     """
-    for template_name in template_names or templates:
+    if not template_names:
+        template_names = [name for name, data in templates.items() if not data.get('optional')]
+    for template_name in template_names:
         upload_template_and_reload(template_name)
     sudo('systemctl daemon-reload')
 
@@ -295,48 +495,81 @@ def python_install(upgrade=False):
     """
     Install required python packages.
     """
+    # `pip freeze` of the virtualenv from cached host facts
+    installed_packages = get_host_facts()['pip']
     with virtualenv():
-        installed_packages = run('pip freeze').split()
         install_command = 'pip install {}'.format('-U' if upgrade else '')
         install_packages(install_command,
                          'python-requirements.txt',
                          installed_packages=installed_packages)
+    invalidate_host_facts()
 
 
 @task
 def git_clone(recreate=True):
     """
-    Run initial `git clone` into BASE_DIR.
+    Run initial shallow `git clone` into BASE_DIR.
     """
+    check_plain_layout()
     with cd(env.base_dir):
         # Check for existing git directory. If exists and recreate, delete.
         if exists(env.project_dir):
             if not recreate:
-                git_pull()
+                return git_pull()
             else:
                 # Backup the folder
                 date_string = datetime.datetime.now().strftime('%Y%m%d%_H%M%S')
-                repo_original_path = os.path.normpath(os.path.join(env.project_dir, '..'))
-                repo_backup_path = '{}.{}'.format(repo_original_path, date_string)
-                run_check('mv {} {}'.format(repo_original_path, repo_backup_path))
+                repo_backup_path = '{}.{}'.format(env.repo_dir, date_string)
+                run_check('mv {} {}'.format(env.repo_dir, repo_backup_path))
         # Clone
-        result = run_check('git clone --branch {} {}'.format(env.git_branch, env.git_uri))
+        result = run_check('git clone {depth}--branch {branch} {uri}'.format(
+            depth=get_git_depth_option(),
+            branch=env.git_branch,
+            uri=env.git_uri))
     return result
 
 
+def get_git_depth_option():
+    """
+    Return --depth option for git clone/fetch, empty for full history.
+    """
+    depth = int(env.git_depth)
+    return '--depth {} '.format(depth) if depth else ''
+
+
 @task
 @log_call
 def git_pull(branch=None):
     """
-    Update git by pulling.
+    Update git by fetching only given branch or tag and resetting to its commit.
+    Returns (old commit, new commit).
     """
     if not branch:
         branch = env.git_branch
-    with cd(env.project_dir):
-        run_check('git fetch')
-        run_check('git checkout {}'.format(branch))
-        run_check('git pull origin {}'.format(branch))
-        run_check('find . -name "*pyc" -delete', use_sudo=True)
+    with cd(env.repo_dir):
+        run_check('git fetch {}origin {}'.format(get_git_depth_option(), branch))
+    return git_reset('FETCH_HEAD')
+
+
+@task
+@log_call
+def git_reset(commit):
+    """
+    Reset repo to given local commit, e.g. previously deployed one.
+    Remove bytecode only for python files changed between old and new commits.
+    Returns (old commit, new commit).
+    """
+    with cd(env.repo_dir):
+        old_commit = run_check('git rev-parse HEAD').strip()
+        run_check('git reset --hard {}'.format(commit))
+        new_commit = run_check('git rev-parse HEAD').strip()
+        if old_commit != new_commit:
+            # paths are relative to repo root, remove both py2 and __pycache__ bytecode
+            run_check('git diff --name-only {} {} -- "*.py" | while read f; do '
+                      'rm -f "${{f}}c" "$(dirname "$f")/__pycache__/$(basename "${{f%.py}}")".*.pyc; '
+                      'done'.format(old_commit, new_commit), use_sudo=True)
+    print(green('Updated {} -> {}'.format(old_commit, new_commit)))
+    return old_commit, new_commit
 
 
 @task
@@ -380,27 +613,121 @@ def create_ssh_keys():
     run_check('cat ~/.ssh/id_rsa.pub')
 
 
-@task
-def setup_new_app_instance(install_project=False):
-    """
-    Setup a new app instance from base Ubuntu image
-    """
-    debian_install()
-    locales_install()
-    postgres_create()
-    init_daemon_install()
-    debian_upgrade_reboot()
-    create_base_directory()
-    python_install()
+# Provisioning steps graph: step name -> options
+#  requires: steps that must be completed before
+#  apt: step uses apt/dpkg lock, such steps are serialized
+#  exclusive: step may reboot the host, runs alone in the main process
+PROVISION_STEPS = OrderedDict((
+    ('debian_install', {'requires': [], 'apt': True}),
+    ('locales_install', {'requires': ['debian_install']}),
+    ('postgres_create', {'requires': ['locales_install']}),
+    ('init_daemon_install', {'requires': ['debian_install'], 'exclusive': True}),
+    ('debian_upgrade_reboot', {'requires': ['init_daemon_install'], 'exclusive': True}),
+    ('create_base_directory', {'requires': ['debian_upgrade_reboot']}),
+    ('python_install', {'requires': ['create_base_directory']}),
     # RabbitMQ is used as message broker.
-    rabbitmq_install()
+    ('rabbitmq_install', {'requires': ['debian_upgrade_reboot'], 'apt': True}),
     # Installing redis to allow easy switching and for possible usage as key-value storage.
-    redis_install()
-    java_install()
-    elasticsearch_install()
-    theme_install()
-    jqwidgets_install()
-    # stanford_install()
+    ('redis_install', {'requires': ['debian_upgrade_reboot']}),
+    ('java_install', {'requires': ['debian_upgrade_reboot'], 'apt': True}),
+    ('elasticsearch_install', {'requires': ['java_install'], 'apt': True}),
+    ('theme_install', {'requires': ['create_base_directory']}),
+    ('jqwidgets_install', {'requires': ['create_base_directory']}),
+    # ('stanford_install', {'requires': ['python_install']}),
+))
+
+
+def get_provisioned_steps():
+    """
+    Return provisioning steps completed on the host.
+    """
+    ret = run('cat {} 2>/dev/null'.format(env.provision_state_file), warn_only=True)
+    return set(ret.split()) & set(PROVISION_STEPS)
+
+
+def run_provision_step(step_name):
+    """
+    Run provisioning step and checkpoint it on success.
+    """
+    globals()[step_name]()
+    run_check('echo {} >> {}'.format(step_name, env.provision_state_file))
+
+
+def run_provision_step_process(step_name):
+    """
+    Run provisioning step in a child process, with its own connection.
+    """
+    def target():
+        connections.clear()
+        try:
+            run_provision_step(step_name)
+        except BaseException as e:
+            print(red('Step {} failed: {}'.format(step_name, e)))
+            sys.exit(1)
+        finally:
+            disconnect_all()
+
+    process = multiprocessing.Process(target=target, name=step_name)
+    process.start()
+    return process
+
+
+@task
+def setup_new_app_instance(install_project=False, jobs=None, reset=False):
+    """
+    Setup a new app instance from base Ubuntu image.
+    Independent steps run concurrently, apt steps are serialized,
+    completed steps are checkpointed so a failed run resumes where it stopped.
+    """
+    check_plain_layout()
+    jobs = int(jobs or env.provision_jobs)
+    if reset:
+        run('rm -f {}'.format(env.provision_state_file))
+    done = get_provisioned_steps()
+    if done:
+        print(yellow('Already provisioned steps: {}'.format(', '.join(sorted(done)))))
+    running = {}
+    failed = []
+
+    while True:
+        # collect finished steps
+        for step_name, process in list(running.items()):
+            if process.is_alive():
+                continue
+            del running[step_name]
+            if process.exitcode == 0:
+                done.add(step_name)
+            else:
+                failed.append(step_name)
+
+        pending = [step_name for step_name in PROVISION_STEPS
+                   if step_name not in done and step_name not in running]
+        if failed or not pending:
+            if not running:
+                break
+        else:
+            ready = [step_name for step_name in pending
+                     if set(PROVISION_STEPS[step_name]['requires']) <= done]
+            for step_name in ready:
+                options = PROVISION_STEPS[step_name]
+                if options.get('exclusive'):
+                    if not running:
+                        run_provision_step(step_name)
+                        done.add(step_name)
+                    break
+                if len(running) >= jobs:
+                    break
+                if options.get('apt') and any(PROVISION_STEPS[name].get('apt') for name in running):
+                    continue
+                running[step_name] = run_provision_step_process(step_name)
+            if not ready and not running:
+                raise RuntimeError('Unable to resolve provisioning steps: {}'.format(', '.join(pending)))
+        time.sleep(1)
+
+    # child processes used their own connections
+    disconnect_all()
+    if failed:
+        raise RuntimeError('Provisioning failed on steps: {}. Re-run to resume.'.format(', '.join(failed)))
 
     if install_project:
         install_project_files()
@@ -413,28 +740,29 @@ def install_project_files():
     upload_templates(['nginx', 'uwsgi-init', 'uwsgi',
                       'settings', 'run', '502'])
 
-    # run migrations without Django's system check
-    manage('force_migrate')
-    # manage('migrate --noinput')
-
-    # load roles, statuses, status groups, etc
-    manage('loadnewdata fixtures/common/*.json')
-    manage('loadnewdata fixtures/private/*.json')
-
-    # create superuser
-    create_superuser()
-
-    # setup site object
-    manage('set_site')
-
-    # collect static
-    manage('collectstatic -v 0 --noinput')
+    commands = [
+        # run migrations without Django's system check
+        'force_migrate',
+        # 'migrate --noinput',
+        # load roles, statuses, status groups, etc
+        'loadnewdata fixtures/common/*.json',
+        'loadnewdata fixtures/private/*.json',
+        # create superuser
+        get_create_superuser_command(),
+        # setup site object
+        'set_site',
+        # collect static
+        'collectstatic -v 0 --noinput',
+    ]
+    manage_batch(*[command for command in commands if command])
 
     # download nltk data
     nltk_download()
 
     ssl_install()
 
+    logs_install()
+
     start()
 
 
@@ -445,6 +773,7 @@ def create_dirs():
     """
     # remove default nginx config
     sudo('rm -f /etc/nginx/sites-enabled/default')
+    create_template_dirs()
     # create static and media dirs
     mkdir(STATIC_ROOT, env.user, env.user, True)
     mkdir(MEDIA_ROOT, env.user, env.user, True)
@@ -461,11 +790,38 @@ def create_dirs():
         sudo('chown -R {}:{} {}'.format(env.user, env.user, log_path))
 
 
+def create_template_dirs():
+    """
+    Create dirs nginx and django settings templates point to: upload temp dirs and microcache dir.
+    """
+    if env.get('nginx_microcache'):
+        sudo('mkdir -p /var/cache/nginx')
+    # private upload temp dirs for nginx and django
+    for name, owner in (('nginx', 'www-data'), ('django', env.user)):
+        path = os.path.join(env.upload_temp_dir, name)
+        mkdir(path, owner, owner, True)
+        sudo('chmod 700 {}'.format(path))
+
+
+@task
+@log_call
+def logs_install():
+    """
+    Install logrotate rules with compression and size caps for app, celery and uwsgi logs,
+    rotated hourly; if log_ship_target is set, ship logs in batches with rsyslog.
+    """
+    upload_templates(['logrotate', 'logrotate-cron'])
+    sudo('logrotate -d /etc/logrotate.d/{} 2>&1 | tail -n 5'.format(env.templates_prefix))
+    if env.get('log_ship_target'):
+        upload_template_and_reload('rsyslog')
+
+
 @task
 def create_base_directory(clean=False):
     """
     Create base directory.
     """
+    check_plain_layout()
     # Check if we want to clean.
     if clean and exists(env.base_dir):
         clean_base_directory()
@@ -518,6 +874,7 @@ def restart_service(service_name):
     """
     cmd = 'restart' if is_active(service_name) else 'start'
     sudo('systemctl %s %s' % (cmd, service_name))
+    invalidate_host_facts()
 
 
 @task
@@ -527,6 +884,7 @@ def stop_service(service_name):
     """
     if is_active(service_name):
         sudo('systemctl stop %s' % service_name)
+    invalidate_host_facts()
 
 
 @task
@@ -536,6 +894,7 @@ def start_service(service_name):
     """
     if not is_active(service_name):
         sudo('systemctl start %s' % service_name)
+    invalidate_host_facts()
 
 
 @task
@@ -551,20 +910,38 @@ def stop_celery(kill_process=False):
                 ve_dir=env.virtualenv_dir))
 
 
+def run_celery_multi(args):
+    """
+    Run `celery multi` as user, within celery slice if celery resources profile is set.
+    """
+    command = '{run_as_root}NLTK_DATA={nltk_data_dir} {ve_dir}/bin/celery multi {args}'.format(
+        run_as_root='C_FORCE_ROOT ' if env.celery_run_as_root == 'true' else '',
+        nltk_data_dir=env.nltk_data_dir,
+        ve_dir=env.virtualenv_dir,
+        args=args)
+    if not env.get('resources_celery'):
+        return run(command)
+    nice = parse_resources(env.resources_celery).get('Nice')
+    return sudo('systemd-run --quiet --scope --slice={slice} sudo -u {user} {nice}env {command}'.format(
+        slice=get_resources_units()['celery'],
+        user=env.user,
+        nice='nice -n {} '.format(nice) if nice else '',
+        command=command))
+
+
 @task
 def start_celery():
     """
     Start celery workers
     """
+    # /run is cleared on boot
+    mkdir(env.celery_pid_dir, use_sudo=True)
+    files = '--pidfile={}/%n.pid --logfile={}/logs/%n%I.log'.format(env.celery_pid_dir, env.project_dir)
     with cd(env.project_dir):
-        run('{run_as_root}{ve_dir}/bin/celery multi restart '
-            'worker -A apps -B -Q serial --concurrency=1 -Ofair -l DEBUG -n beat@%h'.format(
-            run_as_root='C_FORCE_ROOT ' if env.celery_run_as_root == 'true' else '',
-            ve_dir=env.virtualenv_dir))
-        run('{run_as_root}{ve_dir}/bin/celery multi restart '
-            'worker1 -A apps -Q default,high_priority --concurrency=1 -Ofair -n default_priority@%h'.format(
-            run_as_root='C_FORCE_ROOT ' if env.celery_run_as_root == 'true' else '',
-            ve_dir=env.virtualenv_dir))
+        run_celery_multi('restart worker -A apps -B -Q serial --concurrency=1 -Ofair -l {} -n beat@%h '
+                         '{}'.format(env.celery_log_level, files))
+        run_celery_multi('restart worker1 -A apps -Q default,high_priority --concurrency=1 -Ofair -l {} '
+                         '-n default_priority@%h {}'.format(env.celery_log_level, files))
 
 
 @task
@@ -592,6 +969,17 @@ def purge_celery():
             celery_app=env.celery_app))
 
 
+@task
+def cleanup_celery_results():
+    """
+    Remove expired celery task results now (for database result backends)
+    """
+    with cd(env.project_dir):
+        run('{ve_dir}/bin/celery -A {celery_app} call celery.backend_cleanup'.format(
+            ve_dir=env.virtualenv_dir,
+            celery_app=env.celery_app))
+
+
 @task
 def stop_redis():
     stop_service('redis_6379')
@@ -625,6 +1013,57 @@ def start():
     start_celery()
     # redis doesn't start properly
     # start_redis()
+    if env.get('warmup_urls'):
+        warmup()
+
+
+def get_uwsgi_processes():
+    """
+    Number of uwsgi workers from the deployed uwsgi.ini.
+    """
+    ret = run("grep -E '^processes\\s*=' {}".format(get_templates()['uwsgi']['remote_path']),
+              show=False, warn_only=True)
+    return int(ret.split('=')[1]) if ret.succeeded and ret.strip() else 1
+
+
+@task
+@log_call
+def warmup(urls=None, rounds=None, strict=None):
+    """
+    Warm up uwsgi workers after start: prime django cache backends, then request each
+    of warmup_urls (separated by ;) on every worker through the local uwsgi socket.
+    Reports per-url latency of the first (cold) and last round; if the node isn't ready
+    it warns, or fails with warmup:strict=1 (or warmup_strict set in fabricrc).
+    """
+    script_path = put_script('warmup.py')
+    with cd(env.project_dir), hide('stdout'):
+        ret = run_check("{python_bin} {script} --socket {socket} --host {host} --urls '{urls}' "
+                        "--workers {workers} --rounds {rounds} --timeout {timeout} --prime-cache".format(
+            python_bin=env.python_bin,
+            script=script_path,
+            socket=env.uwsgi_socket,
+            host=env.dns_name,
+            urls=urls or env.warmup_urls,
+            workers=get_uwsgi_processes(),
+            rounds=rounds or env.warmup_rounds,
+            timeout=env.warmup_timeout), combine_stderr=False)
+    remove_script(script_path)
+    report = json.loads(ret.splitlines()[-1])
+
+    for alias, seconds in sorted((report['caches'] or {}).items()):
+        print('cache {}: {}'.format(alias, seconds))
+    for url, url_rounds in sorted(report['urls'].items()):
+        color = green if url_rounds[-1]['ok'] else red
+        print(color('{:<50} cold {:>7.3f}-{:<7.3f}s  warm {:>7.3f}-{:<7.3f}s  {}'.format(
+            url, url_rounds[0]['min'], url_rounds[0]['max'],
+            url_rounds[-1]['min'], url_rounds[-1]['max'], ','.join(url_rounds[-1]['statuses']))))
+    if not report['ready']:
+        if strict or env.get('warmup_strict'):
+            raise RuntimeError('Node {} is not ready after warm-up.'.format(env.host))
+        print(yellow('WARNING: node {} is not ready after warm-up.'.format(env.host)))
+        return report
+    print(green('Node {} is ready.'.format(env.host), bold=True))
+    return report
 
 
 @task
@@ -637,6 +1076,169 @@ def restart():
     start()
 
 
+def set_service_nofile_limit(service_name):
+    """
+    Set LimitNOFILE for service with systemd drop-in, needs daemon-reload.
+    """
+    override_dir = '/etc/systemd/system/{}.service.d'.format(service_name)
+    sudo('mkdir -p {}'.format(override_dir))
+    sudo("printf '# Managed by fabric\\n[Service]\\nLimitNOFILE={}\\n' > {}".format(
+        env.nofile_limit, os.path.join(override_dir, 'limits.conf')))
+
+
+def get_tuned_units():
+    """
+    Return units of tuned services, template services replaced by their loaded instances.
+    """
+    units = []
+    for service_name in TUNED_SERVICES:
+        if service_name.endswith('@'):
+            ret = sudo("systemctl list-units --all --no-legend '{}*' | awk '{{print $1}}'".format(service_name),
+                       warn_only=True)
+            units.extend(unit[:-len('.service')] for unit in ret.split()
+                         if unit.startswith(service_name) and unit.endswith('.service'))
+        else:
+            units.append(service_name)
+    return units
+
+
+def get_host_tuning(units):
+    """
+    Return current values of tuned kernel settings, transparent hugepages
+    and LimitNOFILE of given units in a single call.
+    """
+    ret = sudo('sysctl {keys}; echo thp $(cat /sys/kernel/mm/transparent_hugepage/enabled); '
+               'for unit in {units}; do echo $unit $(systemctl show -p LimitNOFILE $unit); done'.format(
+                   keys=' '.join(TUNED_SYSCTL), units=' '.join(units)), warn_only=True)
+    values = OrderedDict()
+    for line in ret.splitlines():
+        if ' = ' in line:
+            key, value = line.split(' = ', 1)
+            values[key.strip()] = value.strip()
+        elif line.startswith('thp '):
+            # e.g. "always madvise [never]"
+            values['transparent_hugepage'] = line.split('[')[-1].split(']')[0]
+        elif 'LimitNOFILE=' in line:
+            unit, limit = line.split(None, 1)
+            values['{}.LimitNOFILE'.format(unit)] = limit.split('=', 1)[1].strip()
+    return values
+
+
+@task
+@log_call
+def tune_host(restart_services=False):
+    """
+    Apply managed sysctl.d and limits.d profile, disable transparent hugepages
+    and set LimitNOFILE for services; validate and report before/after values.
+    Services pick up new file limits on restart: tune_host:restart_services=1
+    """
+    units = get_tuned_units()
+    before = get_host_tuning(units)
+
+    upload_templates(['sysctl', 'limits', 'thp'])
+    for service_name in TUNED_SERVICES:
+        set_service_nofile_limit(service_name)
+    sudo('systemctl daemon-reload')
+    if restart_services:
+        for unit in units:
+            if is_active(unit):
+                restart_service(unit)
+
+    after = get_host_tuning(units)
+    expected = OrderedDict((key, env[setting]) for key, setting in TUNED_SYSCTL.items())
+    expected['transparent_hugepage'] = 'never'
+    for unit in units:
+        expected['{}.LimitNOFILE'.format(unit)] = env.nofile_limit
+
+    failed = []
+    for key, value in expected.items():
+        ok = after.get(key) == str(value)
+        if not ok:
+            failed.append(key)
+        print((green if ok else red)('{:<40} {:>12} -> {:>12}  (expected {})'.format(
+            key, before.get(key, '-'), after.get(key, '-'), value)))
+    if failed:
+        print(yellow('Not applied yet: {}. Restart services or reboot to apply file limits.'.format(
+            ', '.join(failed))))
+
+
+def get_resources_units():
+    """
+    Return services with resources profiles and their systemd units;
+    celery workers are started by `celery multi`, so they are placed into a slice.
+    """
+    return OrderedDict((
+        ('uwsgi', '{}.service'.format(env.uwsgi_name)),
+        ('celery', '{}-celery.slice'.format(env.templates_prefix)),
+        ('elasticsearch', 'elasticsearch.service'),
+        # settings for all postgresql cluster instances, postgresql.service is a wrapper
+        ('postgresql', 'postgresql@.service'),
+        ('redis', 'redis_6379.service'),
+        ('rabbitmq', 'rabbitmq-server.service'),
+    ))
+
+
+def parse_resources(profile):
+    """
+    Parse resources profile, e.g. "CPUWeight=100 MemoryMax=60pct Nice=10";
+    memory values ending with "pct" are sized from host RAM.
+    """
+    resources = OrderedDict()
+    for token in profile.split():
+        key, value = token.split('=', 1)
+        if value.endswith('pct'):
+            memory_total = get_host_facts()['memory']['memtotal']
+            value = '{}M'.format(memory_total * int(value[:-3]) // 100)
+        resources[key] = value
+    return resources
+
+
+def get_resources_directives(resources):
+    """
+    Return systemd directives for resources, with legacy cgroup v1 equivalents
+    for systemd < 231 (unknown directives are ignored by systemd).
+    """
+    directives = OrderedDict(resources)
+    if 'CPUWeight' in resources:
+        directives['CPUShares'] = int(resources['CPUWeight']) * 1024 // 100
+    if 'IOWeight' in resources:
+        directives['BlockIOWeight'] = min(max(int(resources['IOWeight']), 10), 1000)
+    if 'MemoryMax' in resources:
+        directives['MemoryLimit'] = resources['MemoryMax']
+    return directives
+
+
+@task
+@log_call
+def resources_install(restart_services=False):
+    """
+    Render CPUWeight, MemoryHigh/MemoryMax, IOWeight and Nice settings for managed services
+    from resources_<service> fabricrc profiles as systemd drop-ins.
+    Services pick up settings on restart: resources_install:restart_services=1
+    """
+    for service, unit in get_resources_units().items():
+        profile = env.get('resources_{}'.format(service))
+        if not profile:
+            continue
+        directives = get_resources_directives(parse_resources(profile))
+        if unit.endswith('.slice'):
+            # Nice is applied to celery command, it isn't a slice setting
+            directives.pop('Nice', None)
+            section = 'Slice'
+            sudo("printf '[Unit]\\nDescription={} slice\\n' > /etc/systemd/system/{}".format(service, unit))
+        else:
+            section = 'Service'
+        override_dir = '/etc/systemd/system/{}.d'.format(unit)
+        sudo('mkdir -p {}'.format(override_dir))
+        sudo("printf '# Managed by fabric resources_install task\\n[{section}]\\n{directives}' > {path}".format(
+            section=section,
+            directives=''.join('{}={}\\n'.format(key, value) for key, value in directives.items()),
+            path=os.path.join(override_dir, 'resources.conf')))
+    sudo('systemctl daemon-reload')
+    if restart_services:
+        restart()
+
+
 """
 --------------------------------
 Deploy methods
@@ -644,36 +1246,384 @@ Deploy methods
 """
 
 
+def get_deployed_state():
+    """
+    Return (commit, requirements checksum) saved by the last successful deploy.
+    """
+    ret = run('cat {} 2>/dev/null'.format(env.deployed_state_file), warn_only=True)
+    tokens = ret.split()
+    return tokens if len(tokens) == 2 else (None, None)
+
+
+def save_deployed_state(commit, requirements_checksum):
+    # replace the file, releases share it as a hardlink
+    run_check('echo {commit} {checksum} > {path}.tmp && mv {path}.tmp {path}'.format(
+        commit=commit, checksum=requirements_checksum, path=env.deployed_state_file))
+
+
+def get_requirements_checksum():
+    """
+    Calculate checksum of python requirements from given custom and base config dirs.
+    """
+    checksum = hashlib.sha256()
+    for config_dir in (env.base_config_dir, env.config_dir):
+        path = os.path.join(config_dir, 'python-requirements.txt')
+        if os.path.exists(path):
+            checksum.update(get_local_checksum(path).encode())
+    return checksum.hexdigest()
+
+
+def get_changed_files(old_commit, new_commit):
+    """
+    Return files changed between commits (relative to repo root),
+    None if old commit is unknown or missing in the (shallow) history.
+    """
+    if not old_commit:
+        return None
+    with cd(env.repo_dir):
+        if run('git cat-file -e {}^{{commit}}'.format(old_commit), warn_only=True).failed:
+            return None
+        return run_check('git diff --name-only {} {}'.format(old_commit, new_commit)).split()
+
+
+def update_project(force=False, commit=None):
+    """
+    Pull (or reset to commit) and update project in current env paths.
+    Requirements install, migrations and collectstatic run only if related
+    files changed since the last deployed commit, or if force.
+    Returns (new commit, requirements checksum).
+    """
+    # Git pull
+    _, new_commit = git_reset(commit) if commit else git_pull()
+
+    deployed_commit, deployed_requirements_checksum = get_deployed_state()
+    changed_files = None if force else get_changed_files(deployed_commit, new_commit)
+    requirements_checksum = get_requirements_checksum()
+
+    def changed(match):
+        return changed_files is None or any(match(path) for path in changed_files)
+
+    requirements_changed = requirements_checksum != deployed_requirements_checksum or \
+        changed(lambda path: 'requirements' in os.path.basename(path))
+    if requirements_changed:
+        python_install()
+    else:
+        print(yellow('Requirements not changed, skip python_install.'))
+
+    # run migrations
+    if requirements_changed or changed(lambda path: '/migrations/' in path):
+        manage('migrate --noinput')
+    else:
+        print(yellow('Migrations not changed, skip migrate.'))
+
+    # collect static before services start
+    if requirements_changed or changed(lambda path: 'static' in path.split('/')):
+        manage('collectstatic -v 0 --noinput')
+    else:
+        print(yellow('Static files not changed, skip collectstatic.'))
+
+    return new_commit, requirements_checksum
+
+
 @task
 @log_call
-def deploy(do_upload_templates=False):
+def deploy(do_upload_templates=False, force=False, commit=None):
     """
     Refresh a site by pulling latest repository changes,
     deploying newest configuration templates,
     and restarting services.
+    Requirements install, migrations and collectstatic run only if related
+    files changed since the last deployed commit, or if force.
+    commit deploys given local commit instead, e.g. to roll back;
+    applied migrations are not reverted.
+    With use_releases, deploys into a new release (see deploy_release).
     """
+    if env.get('use_releases'):
+        return deploy_release(do_upload_templates, force, commit)
 
     # Stop services
     stop()
 
-    # remove *pyc files
-    run_check('find {} -name "*pyc" -delete'.format(env.project_dir), use_sudo=True)
-
     # upload config. files
     if do_upload_templates:
         upload_templates(['nginx', 'uwsgi-init', 'uwsgi', 'settings'])
 
-    # Git pull
-    git_pull()
-    python_install()
-
-    # run migrations
-    manage('migrate --noinput')
+    new_commit, requirements_checksum = update_project(force, commit)
 
     # Start services
     start()
 
-    manage('collectstatic -v 0 --noinput')
+    save_deployed_state(new_commit, requirements_checksum)
+
+
+def check_plain_layout():
+    """
+    Install tasks create checkout and virtualenv in base dir; with use_releases,
+    releases are created by deploy only.
+    """
+    if env.get('use_releases'):
+        raise RuntimeError('Install with use_releases disabled, then enable it: '
+                           'the first deploy turns base dir checkout and virtualenv into a release.')
+
+
+@contextmanager
+def release_env(release_dir):
+    """
+    Point project and virtualenv paths to given release instead of current one.
+    """
+    set_install_dir(release_dir)
+    try:
+        yield
+    finally:
+        set_install_dir(env.install_dir)
+
+
+def get_shared_paths():
+    return [path.strip() for path in env.release_shared_paths.split(';') if path.strip()]
+
+
+def get_current_release():
+    """
+    Return name of current release, None before the first release.
+    """
+    ret = run('readlink {}'.format(env.current_dir), warn_only=True)
+    return os.path.basename(ret.strip()) if ret.succeeded and ret.strip() else None
+
+
+def get_releases():
+    """
+    Return release names from oldest to newest.
+    """
+    ret = run('ls -1 {}'.format(env.releases_dir), warn_only=True)
+    return sorted(ret.split()) if ret.succeeded else []
+
+
+def create_release():
+    """
+    Create new timestamped release as a hardlinked copy of checkout and virtualenv
+    of the current release, or of the base dir ones on the first run.
+    Paths shared by releases (media, logs, local settings) are linked to shared dir.
+    Returns release dir.
+    """
+    current_release = get_current_release()
+    source_dir = os.path.join(env.releases_dir, current_release) if current_release else env.base_dir
+    release_dir = os.path.join(env.releases_dir, datetime.datetime.now().strftime('%Y%m%d%H%M%S'))
+    repo_path = os.path.normpath(os.path.join(env.project_path, '..'))
+
+    # the first release moves shared paths of base dir checkout into shared dir, linked back
+    for path in get_shared_paths():
+        source_path = os.path.join(source_dir, env.project_path, path)
+        shared_path = os.path.join(env.shared_dir, path)
+        if not exists(shared_path) and exists(source_path) and not run(
+                'test -L {}'.format(source_path), warn_only=True).succeeded:
+            run_check('mkdir -p {} && mv {} {} && ln -s {} {}'.format(
+                os.path.dirname(shared_path), source_path, shared_path, shared_path, source_path),
+                use_sudo=True)
+        elif not exists(shared_path) and '.' not in path:
+            # paths with extension are files, e.g. local_settings.py uploaded later
+            mkdir(shared_path, use_sudo=True)
+
+    # unchanged files are hardlinked; git, pip and sed replace files instead of writing in place
+    mkdir(release_dir, use_sudo=True)
+    run_check('rsync -a --link-dest={src} {excludes} {src}/ {dst}/'.format(
+        src=os.path.join(source_dir, repo_path),
+        dst=os.path.join(release_dir, repo_path),
+        excludes=' '.join('--exclude=/{}'.format(os.path.relpath(os.path.join(env.project_path, path), repo_path))
+                          for path in get_shared_paths())), use_sudo=True)
+    source_ve = os.path.join(source_dir, env.ve_dir)
+    release_ve = os.path.join(release_dir, env.ve_dir)
+    run_check('rsync -a --link-dest={src} {src}/ {dst}/'.format(src=source_ve, dst=release_ve), use_sudo=True)
+    # virtualenv isn't relocatable: fix absolute paths in scripts and path files
+    run_check('grep -rlIF {src} {dst}/bin {dst}/lib/python*/site-packages/*.pth '
+              '{dst}/lib/python*/site-packages/*.egg-link 2>/dev/null | xargs -r sed -i "s#{src}#{dst}#g"'.format(
+        src=source_ve, dst=release_ve), use_sudo=True)
+    for path in get_shared_paths():
+        run_check('ln -sfn {} {}'.format(os.path.join(env.shared_dir, path),
+                                         os.path.join(release_dir, env.project_path, path)), use_sudo=True)
+    sudo('chown {}:{} {}'.format(env.user, env.user, release_dir))
+    return release_dir
+
+
+def switch_release(release_dir):
+    """
+    Atomically point current symlink to release dir.
+    """
+    run_check('ln -sfn {dir} {current}.tmp && mv -T {current}.tmp {current}'.format(
+        dir=release_dir, current=env.current_dir), use_sudo=True)
+
+
+def cleanup_releases():
+    """
+    Remove releases older than the newest releases_keep ones, never the current one.
+    """
+    current_release = get_current_release()
+    releases = get_releases()
+    for release in releases[:-int(env.releases_keep)]:
+        if release != current_release:
+            sudo('rm -rf {}'.format(os.path.join(env.releases_dir, release)))
+
+
+@task
+@log_call
+def deploy_release(do_upload_templates=False, force=False, commit=None):
+    """
+    Build a new release next to the running one: hardlinked copy of the current release
+    with only changed requirements installed, migrations and collectstatic;
+    then switch current symlink, restart services and remove old releases.
+    The first release re-renders all templates, as they point to base dir paths before.
+    """
+    if not env.get('use_releases'):
+        raise RuntimeError('deploy_release requires use_releases in fabricrc.')
+    first_release = get_current_release() is None
+    release_dir = create_release()
+    with release_env(release_dir):
+        new_commit, requirements_checksum = update_project(force, commit)
+
+    # templates point to current release paths, so they are rendered after the switch
+    switch_release(release_dir)
+    if first_release:
+        upload_templates()
+        if env.get('log_ship_target'):
+            upload_template_and_reload('rsyslog')
+    elif do_upload_templates:
+        upload_templates(['nginx', 'uwsgi-init', 'uwsgi', 'settings'])
+    restart()
+    save_deployed_state(new_commit, requirements_checksum)
+    print(green('Release {} is current.'.format(os.path.basename(release_dir)), bold=True))
+    cleanup_releases()
+
+
+@task
+@log_call
+def releases():
+    """
+    List releases with their deployed commits, current one marked.
+    """
+    current_release = get_current_release()
+    for release in get_releases():
+        state_file = os.path.join(env.releases_dir, release, os.path.relpath(
+            env.deployed_state_file, env.install_dir))
+        commit = run('cat {} 2>/dev/null'.format(state_file), show=False, warn_only=True).split()[:1]
+        line = '{} {}'.format(release, commit[0] if commit else 'not deployed')
+        print(green(line + ' (current)') if release == current_release else line)
+
+
+@task
+@log_call
+def rollback(release=None):
+    """
+    Switch current symlink back to previous (or given) release and restart services.
+    Applied migrations are not reverted.
+    """
+    if not env.get('use_releases'):
+        raise RuntimeError('rollback requires use_releases, use deploy:commit=... instead.')
+    current_release = get_current_release()
+    releases_list = get_releases()
+    if current_release is None:
+        raise RuntimeError('No current release.')
+    if release is None:
+        previous = [name for name in releases_list if name < current_release]
+        if not previous:
+            raise RuntimeError('No release before {}.'.format(current_release))
+        release = previous[-1]
+    if release not in releases_list:
+        raise RuntimeError('Release {} not found.'.format(release))
+    if release == current_release:
+        print(yellow('Release {} is already current.'.format(release)))
+        return
+    switch_release(os.path.join(env.releases_dir, release))
+    restart()
+    print(green('Rolled back {} -> {}'.format(current_release, release), bold=True))
+
+
+def canary_probe():
+    """
+    Short latency probe of the host with benchmark-requests.json mix,
+    return (commit, p95 ms, error rate); a probe without completed requests
+    (e.g. unreachable host) has p95 None and error rate 1.
+    """
+    results_dir = get_results_dir('benchmarks')
+    options = '--concurrency {} --duration {}'.format(env.canary_probe_concurrency, env.canary_probe_duration)
+    if env.get('superuser_username'):
+        options += ' --username {} --password {}'.format(env.superuser_username, env.superuser_password)
+    report = run_http_benchmark(None, options, os.path.join(results_dir, 'canary-{}.json'.format(
+        datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))))
+    with cd(env.repo_dir):
+        commit = run_check('git rev-parse HEAD').strip()
+    level = report['levels'][-1]
+    if not level['requests'] or level['latency_ms']['p95'] is None:
+        print(red('Probe {}: no completed requests'.format(commit)))
+        return commit, None, 1
+    print(blue('Probe {}: p95 {} ms, errors {}'.format(commit, level['latency_ms']['p95'], level['error_rate'])))
+    return commit, level['latency_ms']['p95'], level['error_rate']
+
+
+@task
+@runs_once
+@log_call
+def deploy_canary(threshold=None, do_upload_templates=False, force=False):
+    """
+    Deploy to the first host only and probe its p95 latency; if it stays within threshold
+    (ratio to the baseline p95 of the previous release) and canary_max_error_rate,
+    deploy the rest of hosts, otherwise roll the canary back and abort the rollout,
+    e.g. fab -c remote/fabricrc -H host1,host2 deploy_canary:threshold=1.5
+    Decisions are appended to config dir benchmarks/canary.log.
+    """
+    threshold = float(threshold or env.canary_p95_threshold)
+    canary, hosts = env.all_hosts[0], env.all_hosts[1:]
+    baseline_path = os.path.join(get_results_dir('benchmarks'), 'canary-baseline.json')
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    else:
+        # no stored baseline yet, measure the running release
+        commit, p95, _ = execute(canary_probe, hosts=[canary])[canary]
+        baseline = {'commit': commit, 'p95': p95}
+    if not baseline.get('p95'):
+        raise RuntimeError('No baseline p95 of {} to compare the canary with, check the probe.'.format(canary))
+
+    if env.get('use_releases'):
+        rollback_target = execute(get_current_release, hosts=[canary])[canary]
+    else:
+        rollback_target = execute(get_deployed_state, hosts=[canary])[canary][0]
+    try:
+        execute(deploy, do_upload_templates=do_upload_templates, force=force, hosts=[canary])
+        commit, p95, error_rate = execute(canary_probe, hosts=[canary])[canary]
+    except (RuntimeError, SystemExit) as e:
+        # failed deploy or warm-up (fabric aborts with SystemExit) counts as failed canary
+        print(red('Canary deploy failed: {}'.format(e)))
+        commit, p95, error_rate = None, None, 1
+
+    ratio = round(p95 / baseline['p95'], 3) if p95 is not None else None
+    passed = ratio is not None and ratio <= threshold and error_rate <= float(env.canary_max_error_rate)
+    decision = 'promote' if passed else ('rollback' if rollback_target else 'abort')
+    record = OrderedDict([('time', datetime.datetime.now().isoformat()),
+                          ('host', canary),
+                          ('commit', commit),
+                          ('baseline_commit', baseline['commit']),
+                          ('baseline_p95', baseline['p95']),
+                          ('p95', p95),
+                          ('ratio', ratio),
+                          ('threshold', threshold),
+                          ('error_rate', error_rate),
+                          ('decision', decision)])
+    with open(os.path.join(get_results_dir('benchmarks'), 'canary.log'), 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+    if not passed:
+        if rollback_target and env.get('use_releases'):
+            execute(rollback, release=rollback_target, hosts=[canary])
+        elif rollback_target:
+            execute(deploy, force=force, commit=rollback_target, hosts=[canary])
+        raise RuntimeError('Canary {} p95 {} ms vs baseline {} ms (ratio {}, threshold {}), errors {}: {}.'.format(
+            commit, p95, baseline['p95'], ratio, threshold, error_rate, decision))
+
+    print(green('Canary {} p95 {} ms vs baseline {} ms: promote to {}'.format(
+        commit, p95, baseline['p95'], ', '.join(hosts) or 'no other hosts'), bold=True))
+    if hosts:
+        execute(deploy, do_upload_templates=do_upload_templates, force=force, hosts=hosts)
+    with open(baseline_path, 'w') as f:
+        json.dump({'commit': commit, 'p95': p95}, f)
 
 
 @task
@@ -702,6 +1652,21 @@ def manage(*args):
         sudo('{} manage.py {}'.format(env.python_bin, ' '.join(args)))
 
 
+@task
+def manage_batch(*commands):
+    """
+    Run several django management commands in a single django process,
+    stop on the first failure and output timings,
+    e.g. manage_batch:"migrate --noinput","collectstatic -v 0 --noinput"
+    """
+    script_path = put_script('manage_batch.py')
+    with cd(env.project_dir):
+        run_check('{} {} {}'.format(
+            env.python_bin, script_path, ' '.join("'{}'".format(command) for command in commands)),
+            use_sudo=True)
+    remove_script(script_path)
+
+
 def run_check(command, use_sudo=False, combine_stderr=True, **kw):
     """
     Wrapper around run/sudo that checks for error code/value.
@@ -729,6 +1694,39 @@ def mkdir(path, owner=env.user, group=env.user, use_sudo=False):
     sudo('chown -R {}:{} {}'.format(owner, group, path))
 
 
+def get_remote_temp_dir():
+    """
+    Create a private (0700) temp dir on the host; unlike fixed /tmp paths,
+    other users can't pre-create or swap files in it before they run with sudo.
+    """
+    return run_check('mktemp -d').strip()
+
+
+def put_script(file_name, *module_names):
+    """
+    Upload scripts/<file_name> and helper modules it imports into a new private temp dir,
+    return remote script path. Script outputs go into the same dir, removed by remove_script.
+    """
+    remote_dir = get_remote_temp_dir()
+    for name in (file_name,) + module_names:
+        put(os.path.join(os.path.dirname(__file__), 'scripts', name), os.path.join(remote_dir, name))
+    return os.path.join(remote_dir, file_name)
+
+
+def remove_script(script_path):
+    # files written by scripts run with sudo are owned by root
+    sudo('rm -rf {}'.format(os.path.dirname(script_path)))
+
+
+def get_results_dir(subdir):
+    """
+    Local dir for reports of the host, e.g. config dir benchmarks/.
+    """
+    results_dir = os.path.join(env.config_dir, subdir)
+    os.makedirs(results_dir, exist_ok=True)
+    return results_dir
+
+
 """
 --------------------------------
 Install methods
@@ -785,6 +1783,7 @@ def debian_install(package_list=None, update_cache=True):
                      use_sudo=True)
     uwsgi_install()
     yuglify_install()
+    invalidate_host_facts()
 
 
 @task
@@ -807,8 +1806,10 @@ def debian_upgrade_reboot():
     debian_upgrade() + reboot for first time/kernel installs.
     """
     debian_upgrade()
-    if exists('/var/run/reboot-required', True):
+    invalidate_host_facts()
+    if get_host_facts()['reboot_required']:
         reboot(REBOOT_TIME)
+        invalidate_host_facts()
 
 
 @task
@@ -834,11 +1835,11 @@ def init_daemon_install():
     """
     Switch from upstart to systemd
     """
-    ret = sudo('stat /proc/1/exe')
-    if 'upstart' in ret:
+    if get_host_facts()['init'] == 'upstart':
         sudo('apt-get -y install systemd-sysv ubuntu-standard')
         sudo('update-initramfs -u')
         reboot(REBOOT_TIME)
+        invalidate_host_facts()
 
 
 @task
@@ -886,6 +1887,45 @@ def rabbitmq_install():
     sudo('rabbitmqctl add_vhost contrax1_vhost')
     sudo('rabbitmqctl set_permissions -p contrax1_vhost contrax1 ".*" ".*" ".*"')
 
+    rabbitmq_configure()
+
+
+def get_rabbitmq_version():
+    """
+    Installed rabbitmq-server version as a tuple, e.g. (3, 6, 15).
+    """
+    ret = run("dpkg-query -W -f '${Version}' rabbitmq-server", show=False, warn_only=True)
+    if ret.failed or not ret.strip():
+        raise RuntimeError('rabbitmq-server is not installed.')
+    return tuple(int(part) for part in ret.strip().split('-')[0].split('.')[:3] if part.isdigit())
+
+
+@task
+@log_call
+def rabbitmq_configure():
+    """
+    Write managed rabbitmq.conf (rabbitmq.config for rabbitmq < 3.7) with watermarks
+    sized from host RAM, raise file limits, use lazy queues for bulk queues,
+    enable management and prometheus plugins
+    """
+    version = get_rabbitmq_version()
+    memory = get_host_facts()['memory']['memtotal']
+    env.rabbitmq_memory_high_watermark = '{}MB'.format(
+        int(memory * float(env.rabbitmq_memory_watermark_ratio)))
+    env.rabbitmq_disk_free_limit = '{}MB'.format(
+        int(memory * float(env.rabbitmq_disk_free_ratio)))
+    env.rabbitmq_memory_high_watermark_bytes = int(memory * float(env.rabbitmq_memory_watermark_ratio)) * 1024 ** 2
+    env.rabbitmq_disk_free_limit_bytes = int(memory * float(env.rabbitmq_disk_free_ratio)) * 1024 ** 2
+    set_service_nofile_limit('rabbitmq-server')
+    sudo('systemctl daemon-reload')
+    sudo('rabbitmq-plugins enable rabbitmq_management')
+    if version >= (3, 8):
+        sudo('rabbitmq-plugins enable rabbitmq_prometheus')
+    # sysctl-style rabbitmq.conf is read since rabbitmq 3.7 only
+    upload_template_and_reload('rabbitmq' if version >= (3, 7) else 'rabbitmq-legacy')
+    sudo("rabbitmqctl set_policy -p contrax1_vhost lazy '{}' '{{\"queue-mode\": \"lazy\"}}' "
+         "--apply-to queues".format(env.rabbitmq_lazy_queues))
+
 
 @task
 @log_call
@@ -922,9 +1962,15 @@ def elasticsearch_install():
          '| tee -a /etc/apt/sources.list.d/elastic-6.x.list\'')
     sudo('apt-get update')
     sudo('apt-get --yes --force-yes install elasticsearch')
+    # allow filesystem snapshot repository
+    sudo('mkdir -p {}'.format(env.es_snapshot_path))
+    sudo('chown -R elasticsearch:elasticsearch {}'.format(env.es_snapshot_path))
+    sudo('grep -q "^path.repo:" /etc/elasticsearch/elasticsearch.yml || '
+         'echo "path.repo: {}" >> /etc/elasticsearch/elasticsearch.yml'.format(env.es_snapshot_path))
     sudo('systemctl daemon-reload')
     sudo('systemctl enable elasticsearch.service')
     restart_service('elasticsearch')
+    es_register_snapshot_repository()
 
 
 @task
@@ -940,13 +1986,35 @@ def ssl_install():
 
 @task
 @log_call
-def nltk_download():
-    """
-    Download nltk data
-    """
-    with cd(env.project_dir):
-        sudo('{} -m nltk.downloader averaged_perceptron_tagger punkt stopwords '
-             ' words maxent_ne_chunker wordnet'.format(env.python_bin))
+def nltk_download(jobs=None):
+    """
+    Download missing nltk data into shared NLTK_DATA dir and unpack it
+    """
+    jobs = int(jobs or env.download_jobs)
+    mkdir(env.nltk_data_dir, use_sudo=True)
+    with cd(env.nltk_data_dir):
+        # a package is valid if its unpacked dir exists and isn't empty
+        ret = run_check(' ; '.join(
+            '[ -n "$(ls -A {} 2>/dev/null)" ] || echo {}'.format(path, package)
+            for package, path in NLTK_PACKAGES.items()))
+        missing = [package for package in ret.split() if package in NLTK_PACKAGES]
+        if not missing:
+            print(green('nltk data is up to date, skip.'))
+            return
+        run_check('printf "%s\\n" {packages} | xargs -n 1 -P {jobs} '
+                  '{python_bin} -m nltk.downloader -q -d {nltk_data_dir}'.format(
+            packages=' '.join(missing),
+            jobs=jobs,
+            python_bin=env.python_bin,
+            nltk_data_dir=env.nltk_data_dir))
+        # nltk reads zipped packages slower, so unpack ones left zipped
+        run_check(' ; '.join(
+            '[ -d {path} ] || unzip -q -o {path}.zip -d {dir_path}'.format(
+                path=NLTK_PACKAGES[package],
+                dir_path=os.path.dirname(NLTK_PACKAGES[package]))
+            for package in missing))
+    # make data readable for uwsgi and celery users
+    sudo('chmod -R a+rX {}'.format(env.nltk_data_dir))
 
 
 @task
@@ -961,6 +2029,14 @@ def postgres_create():
     if not database_exists(env.db_name):
         create_database(env.db_name, owner=env.db_user)
 
+    # query statistics for postgres_report, the library is loaded on server start only
+    libraries = psql('SHOW shared_preload_libraries').strip()
+    if 'pg_stat_statements' not in libraries:
+        psql("ALTER SYSTEM SET shared_preload_libraries = '{}'".format(
+            ', '.join([library for library in libraries.split(', ') if library] + ['pg_stat_statements'])))
+        restart_service('postgresql')
+    psql('CREATE EXTENSION IF NOT EXISTS pg_stat_statements', env.db_name)
+
 
 def clean_base_directory():
     """
@@ -1081,6 +2157,380 @@ def get_db_backup():
     run('rm %s' % backup_file)
 
 
+def psql(sql, db_name='postgres'):
+    """
+    Run SQL as postgres superuser, return unaligned tuples output.
+    """
+    with cd('/tmp'):
+        return sudo('psql -tA -d {} -c "{}"'.format(db_name, sql), user='postgres')
+
+
+def run_postgres_report(command, options):
+    """
+    Run scripts/postgres_report.py with virtualenv psycopg2,
+    download JSON results into config dir reports/, return them.
+    """
+    file_name = 'postgres-{}-{}.json'.format(command, datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+    script_path = put_script('postgres_report.py')
+    remote_output = os.path.join(os.path.dirname(script_path), file_name)
+    run_check('PGPASSWORD={db_password} {python_bin} {script} {command} --dbname {db_name} '
+              '--host {db_host} --port {db_port} --user {db_user} {options} --output {output}'.format(
+        db_password=env.db_password,
+        python_bin=env.python_bin,
+        script=script_path,
+        command=command,
+        db_name=env.db_name,
+        db_host=env.db_host,
+        db_port=env.db_port,
+        db_user=env.db_user,
+        options=options,
+        output=remote_output))
+    results_dir = get_results_dir('reports')
+    local_path = os.path.join(results_dir, file_name)
+    get(remote_output, local_path)
+    remove_script(script_path)
+    with open(local_path) as f:
+        return json.load(f)
+
+
+@task
+@log_call
+def postgres_report(top=None, reset=False):
+    """
+    Report top-N queries by total time, mean time and calls (pg_stat_statements),
+    estimated table and index bloat and unused indexes, e.g. postgres_report:top=50
+    reset=1 resets query statistics afterwards, so the next report covers a new period.
+    Results are downloaded into config dir reports/.
+    """
+    report = run_postgres_report('report', '--top {}'.format(top or env.postgres_report_top))
+    if report['statements'] is None:
+        print(yellow('pg_stat_statements is not enabled, run postgres_create.'))
+    else:
+        for item in report['statements']['by_total_time'][:10]:
+            print('{:>12.1f} ms {:>10} calls {:>10.2f} ms/call  {}'.format(
+                item['total_ms'], item['calls'], item['mean_ms'], ' '.join(item['query'].split())[:80]))
+    for table in report['tables'][:10]:
+        print('{table}: {size} bytes, bloat {bloat_ratio}, dead tuples {dead_ratio}'.format(**table))
+    for index in report['unused_indexes']:
+        print(yellow('Unused index {index} on {table}: {size} bytes'.format(**index)))
+    if reset:
+        psql('SELECT pg_stat_statements_reset()', env.db_name)
+
+
+@task
+@log_call
+def postgres_maintenance(threshold=None, limit=None, dry_run=False):
+    """
+    VACUUM (ANALYZE) tables and REINDEX CONCURRENTLY indexes with estimated bloat
+    (or dead tuples) ratio above threshold, worst first, at most limit of each,
+    e.g. postgres_maintenance:threshold=0.5,dry_run=1
+    Results are downloaded into config dir reports/.
+    """
+    options = '--threshold {} --limit {} --min-size {}'.format(
+        threshold or env.postgres_bloat_threshold,
+        limit or env.postgres_maintenance_limit,
+        int(env.postgres_maintenance_min_size_mb) * 1024 ** 2)
+    if dry_run:
+        options += ' --dry-run'
+    report = run_postgres_report('maintain', options)
+    failed = [item for item in report['actions'] if item.get('status') == 'failed']
+    for item in failed:
+        print(red('{action} {relation} failed: {error}'.format(**item)))
+    if not report['actions']:
+        print(green('Nothing to do.'))
+
+
+def es_request(method, path, data=None):
+    """
+    Send request to local elasticsearch, return parsed JSON response.
+    """
+    ret = run_check("curl -s -X{method} '{url}{path}' -H 'Content-Type: application/json'{data}".format(
+        method=method,
+        url=env.es_url,
+        path=path,
+        data=" -d '{}'".format(json.dumps(data)) if data is not None else ''))
+    response = json.loads(ret)
+    if isinstance(response, dict) and response.get('error'):
+        raise RuntimeError('Elasticsearch error: {}'.format(response['error']))
+    return response
+
+
+@task
+def es_register_snapshot_repository(wait=60):
+    """
+    Register filesystem snapshot repository in elasticsearch.
+    """
+    # elasticsearch takes a while to start
+    run_check('for i in $(seq {}); do curl -s {} > /dev/null && break; sleep 1; done'.format(
+        wait, env.es_url))
+    es_request('PUT', '/_snapshot/{}'.format(env.es_snapshot_repository), {
+        'type': 'fs',
+        'settings': {'location': env.es_snapshot_path, 'compress': True}})
+
+
+@task
+@log_call
+def es_snapshot(name=None):
+    """
+    Take incremental elasticsearch snapshot of all indices.
+    """
+    name = name or 'snapshot-{}'.format(datetime.datetime.now().strftime('%Y-%m-%d-%H%M'))
+    response = es_request('PUT', '/_snapshot/{}/{}?wait_for_completion=true'.format(
+        env.es_snapshot_repository, name), {'indices': '*', 'include_global_state': False})
+    print(green('Snapshot {}: {}, {} indices'.format(
+        name, response['snapshot']['state'], len(response['snapshot']['indices']))))
+    return name
+
+
+@task
+def es_snapshots():
+    """
+    List elasticsearch snapshots, return their names from oldest to newest.
+    """
+    response = es_request('GET', '/_snapshot/{}/_all'.format(env.es_snapshot_repository))
+    for snapshot in response['snapshots']:
+        print('{snapshot}: {state}, {start_time}'.format(**snapshot))
+    return [snapshot['snapshot'] for snapshot in response['snapshots']]
+
+
+@task
+@log_call
+def get_es_snapshots():
+    """
+    Download elasticsearch snapshot repository archive (all snapshots) to local machine.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H%M")
+    temp_dir = get_remote_temp_dir()
+    backup_file = os.path.join(temp_dir, 'es_snapshots_{}.tgz'.format(timestamp))
+    sudo('tar czf {} -C {} .'.format(backup_file, env.es_snapshot_path))
+    get(backup_file, env.config_dir)
+    sudo('rm -rf %s' % temp_dir)
+
+
+@task
+@log_call
+def put_es_snapshots(archive_path):
+    """
+    Upload elasticsearch snapshot repository archive made by get_es_snapshots to the host.
+    """
+    temp_dir = get_remote_temp_dir()
+    remote_path = os.path.join(temp_dir, os.path.basename(archive_path))
+    put(archive_path, remote_path)
+    sudo('mkdir -p {}'.format(env.es_snapshot_path))
+    sudo('tar xzf {} -C {}'.format(remote_path, env.es_snapshot_path))
+    sudo('chown -R elasticsearch:elasticsearch {}'.format(env.es_snapshot_path))
+    sudo('rm -rf %s' % temp_dir)
+    es_register_snapshot_repository()
+
+
+@task
+@log_call
+def es_restore(name=None, close_existing=False):
+    """
+    Restore indices from elasticsearch snapshot, the latest one by default.
+    Existing indices must be closed before restore: es_restore:close_existing=1
+    """
+    name = name or es_snapshots()[-1]
+    if close_existing:
+        es_request('POST', '/_all/_close')
+    es_request('POST', '/_snapshot/{}/{}/_restore?wait_for_completion=true'.format(
+        env.es_snapshot_repository, name), {'indices': '*', 'include_global_state': False})
+    print(green('Restored snapshot {}'.format(name)))
+
+
+def put_benchmark_config(file_name, remote_dir):
+    """
+    Upload benchmark config from custom or base config dir into remote dir, return its remote path.
+    """
+    path = os.path.join(env.config_dir, file_name)
+    if not os.path.exists(path):
+        path = os.path.join(env.base_config_dir, file_name)
+    remote_path = os.path.join(remote_dir, file_name)
+    put(path, remote_path)
+    return remote_path
+
+
+@task
+@log_call
+def benchmark(url=None, concurrency=None, duration=None, standin=False):
+    """
+    Run HTTP load benchmark against nginx/uwsgi with request mix from benchmark-requests.json
+    on stepped concurrency levels, e.g. fab 'benchmark:concurrency=1;8;32,duration=60'
+    (quoted, the shell would cut the task arguments at the first ;).
+    Results with uwsgi.ini and nginx.conf checksums are downloaded into config dir benchmarks/.
+    standin=1 runs it locally against a stand-in app.
+    """
+    concurrency = (concurrency or env.benchmark_concurrency).replace(';', ',')
+    duration = duration or env.benchmark_duration
+    file_name = 'benchmark-{}.json'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+    results_dir = get_results_dir('benchmarks')
+    options = '--concurrency {} --duration {}'.format(concurrency, duration)
+    if env.get('superuser_username'):
+        options += ' --username {} --password {}'.format(env.superuser_username, env.superuser_password)
+
+    if standin:
+        _local('python3 {script} --standin --mix {mix} {options} --output {output}'.format(
+            script=os.path.join(os.path.dirname(__file__), 'scripts', 'http_benchmark.py'),
+            mix=os.path.join(env.base_config_dir, 'benchmark-requests.json'),
+            options=options,
+            output=os.path.join(results_dir, file_name)))
+        return
+
+    run_http_benchmark(url, options, os.path.join(results_dir, file_name))
+
+
+def run_http_benchmark(url, options, local_path):
+    """
+    Run scripts/http_benchmark.py on the host, download results to local_path and return them.
+    """
+    if not url:
+        url = 'https://{}'.format(env.dns_name) if env.get('https_redirect') else 'http://127.0.0.1'
+    script_path = put_script('http_benchmark.py', 'benchmark_stats.py')
+    remote_output = os.path.join(os.path.dirname(script_path), os.path.basename(local_path))
+    run_check('python3 {script} --url {url} --mix {mix} {options} --output {output} '
+              '--config-file {uwsgi_ini} --config-file {nginx_conf}'.format(
+        script=script_path,
+        url=url,
+        mix=put_benchmark_config('benchmark-requests.json', os.path.dirname(script_path)),
+        options=options,
+        output=remote_output,
+        uwsgi_ini=get_templates()['uwsgi']['remote_path'],
+        nginx_conf=get_templates()['nginx']['remote_path']))
+    get(remote_output, local_path)
+    remove_script(script_path)
+    with open(local_path) as f:
+        return json.load(f)
+
+
+@task
+@log_call
+def benchmark_ingestion(corpus=None, timeout=None):
+    """
+    Load fixed corpus of sample documents into MEDIA_ROOT/FILEBROWSER_DIRECTORY,
+    trigger processing with ingestion_task and measure documents/second,
+    per-stage and per-worker queue wait and execution time from celery task events.
+    Results are downloaded into config dir benchmarks/.
+    """
+    corpus = corpus or env.get('benchmark_corpus_path')
+    if not corpus or not os.path.isdir(corpus):
+        raise RuntimeError('No "benchmark_corpus_path" directory with sample documents specified.')
+    documents = [name for name in os.listdir(corpus) if os.path.isfile(os.path.join(corpus, name))]
+
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    source_path = os.path.join('benchmark', timestamp)
+    dest_dir = os.path.join(MEDIA_ROOT, FILEBROWSER_DIRECTORY, source_path)
+    mkdir(dest_dir)
+    put(os.path.join(corpus, '*'), dest_dir)
+
+    kwargs = env.ingestion_task_kwargs.replace('{source_path}', source_path) \
+        .replace('{full_path}', dest_dir)
+    file_name = 'ingestion-{}.json'.format(timestamp)
+    script_path = put_script('ingestion_benchmark.py', 'benchmark_stats.py')
+    remote_output = os.path.join(os.path.dirname(script_path), file_name)
+    with cd(env.project_dir):
+        run_check("{python_bin} {script} --celery-app {celery_app} --task '{task}' --kwargs '{kwargs}' "
+                  "--documents {documents} --timeout {timeout} --output {output}".format(
+            python_bin=env.python_bin,
+            script=script_path,
+            celery_app=env.celery_app,
+            task=env.ingestion_task,
+            kwargs=kwargs,
+            documents=len(documents),
+            timeout=timeout or env.benchmark_ingestion_timeout,
+            output=remote_output))
+
+    results_dir = get_results_dir('benchmarks')
+    get(remote_output, os.path.join(results_dir, file_name))
+    remove_script(script_path)
+
+
+def run_startup_profile(script_path, args, use_sudo=False):
+    """
+    Run uploaded scripts/startup_profile.py in project dir, return its JSON output.
+    """
+    with cd(env.project_dir), hide('stdout'):
+        ret = run_check('{} {} {}'.format(env.python_bin, script_path, args),
+                        use_sudo=use_sudo, combine_stderr=False)
+    return json.loads([line for line in ret.splitlines() if line.startswith(('{', '['))][-1])
+
+
+@task
+@log_call
+def profile_startup(top=20):
+    """
+    Measure cold start on the host: import time breakdown of wsgi and the celery app,
+    time to first request of each uwsgi worker (simultaneous requests through the uwsgi socket,
+    one per worker) and celery time to worker ready.
+    Restarts uwsgi and celery. Report is downloaded into config dir benchmarks/.
+    """
+    top = int(top)
+    script_path = put_script('startup_profile.py', 'warmup.py')
+    report = OrderedDict()
+
+    # import time, each target in a fresh process
+    report['imports'] = [run_startup_profile(script_path, 'imports {}'.format(target))[0]
+                         for target in ('wsgi', 'celery:{}'.format(env.celery_app))]
+
+    # uwsgi: app load time from uwsgi log (missing before the first start) and time since restart
+    # until each worker served its first request
+    ret = sudo('wc -l < {}'.format(env.uwsgi_log_file), warn_only=True)
+    log_lines = int(ret) if ret.succeeded else 0
+    started_at = float(run('date +%s.%N'))
+    restart_service(env.uwsgi_name)
+    workers = run_startup_profile(script_path, 'workers-ready --socket {} --host {} --workers {} '
+                                               '--started-at {}'.format(env.uwsgi_socket, env.dns_name,
+                                                                        get_uwsgi_processes(), started_at))
+    report['uwsgi'] = OrderedDict((('seconds', workers[0]['seconds'] if workers else None),
+                                   ('workers', workers)))
+    ret = sudo('tail -n +{} {} | grep "ready in"'.format(log_lines + 1, env.uwsgi_log_file), warn_only=True)
+    report['uwsgi']['apps_ready_seconds'] = [
+        int(line.split('ready in ')[1].split()[0]) for line in ret.splitlines() if 'ready in ' in line]
+
+    # celery: time until each node answers ping, including `multi restart` stopping running workers
+    started_at = float(run('date +%s.%N'))
+    start_celery()
+    ready = run_startup_profile(script_path, 'celery-ready {} --nodes 2'.format(env.celery_app))
+    report['celery'] = OrderedDict(
+        (node, round(ready_at - started_at, 3)) for node, ready_at in sorted(ready.items()))
+    remove_script(script_path)
+
+    for imports in report['imports']:
+        print(green('{target}: {total_seconds}s'.format(**imports), bold=True))
+        for item in imports['by_cumulative'][:top]:
+            print('{:>10.3f}s {:>10.3f}s  {}'.format(
+                item['cumulative_us'] / 1e6, item['self_us'] / 1e6, item['module']))
+    print(green('uwsgi first request: {}s, apps ready in: {}s'.format(
+        report['uwsgi']['seconds'], report['uwsgi']['apps_ready_seconds']), bold=True))
+    for number, worker in enumerate(report['uwsgi']['workers'], 1):
+        print('  worker {}: first request served at {}s (request {}s, status {})'.format(
+            number, worker['seconds'], worker['request_seconds'], worker['status']))
+    for node, seconds in report['celery'].items():
+        print(green('celery {} ready: {}s'.format(node, seconds), bold=True))
+
+    results_dir = get_results_dir('benchmarks')
+    file_name = 'startup-{}.json'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+    with open(os.path.join(results_dir, file_name), 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+@task
+@log_call
+def audit_python_licenses(output_format='csv'):
+    """
+    Audit licenses, versions and installed sizes of packages in the deployed virtualenv
+    against python-requirements.txt; report (csv or json) is downloaded into config dir.
+    """
+    script_path = put_script('identify_python_licenses.py')
+    remote_dir = os.path.dirname(script_path)
+    requirements_path = os.path.join(remote_dir, 'python-requirements.txt')
+    put(os.path.join(env.base_config_dir, 'python-requirements.txt'), requirements_path)
+    remote_output = os.path.join(remote_dir, 'licenses.{}'.format(output_format))
+    run_check('{} {} --requirements {} --format {} --output {}'.format(
+        env.python_bin, script_path, requirements_path, output_format, remote_output))
+    get(remote_output, os.path.join(env.config_dir, 'licenses-{}.{}'.format(env.host, output_format)))
+    remove_script(script_path)
+
+
 @task
 def kill(process_name):
     """
@@ -1108,18 +2558,27 @@ def local():
     env.hosts = ['localhost']
 
 
-@task
-def create_superuser():
+def get_create_superuser_command():
     """
-    Create superuser
-    :return:
+    Return create_superuser management command if superuser is configured.
     """
     if env.get('superuser_username'):
-        manage('create_superuser --username {} --password {} --email {}'.format(
+        return 'create_superuser --username {} --password {} --email {}'.format(
             env.superuser_username,
             env.superuser_password,
             env.superuser_email
-        ))
+        )
+
+
+@task
+def create_superuser():
+    """
+    Create superuser
+    :return:
+    """
+    command = get_create_superuser_command()
+    if command:
+        manage(command)
 
 
 @contextmanager
@@ -1132,19 +2591,59 @@ def virtualenv():
             yield
 
 
+def get_local_checksum(path):
+    """
+    Calculate sha256 checksum of a local file.
+    """
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def install_static_archive(archive_path, dest_dir, members):
+    """
+    Extract required archive members into a static dir in a single pass.
+    Skip if dest_dir version marker matches the archive checksum,
+    upload the archive only if it differs from the already uploaded copy.
+    members: mapping of archive member (folder prefix ending with "/" or file)
+    to its destination path relative to dest_dir.
+    """
+    checksum = get_local_checksum(archive_path)
+    marker_path = os.path.join(dest_dir, '.version')
+    if run('cat {} 2>/dev/null'.format(marker_path), warn_only=True).strip() == checksum:
+        print(green('{} is already installed into {}, skip.'.format(
+            os.path.basename(archive_path), dest_dir)))
+        return
+
+    # if not localhost copy archive to a remote archives dir
+    if env.host != 'localhost':
+        archives_dir = os.path.join(env.base_dir, 'archives')
+        mkdir(archives_dir, use_sudo=True)
+        remote_archive_path = os.path.join(archives_dir, os.path.basename(archive_path))
+        if get_remote_checksum(remote_archive_path) != checksum:
+            put(archive_path, remote_archive_path)
+        archive_path = remote_archive_path
+
+    script_path = put_script('extract_zip_members.py')
+    run_check('python3 {script} {archive} {members}'.format(
+        script=script_path,
+        archive=archive_path,
+        members=' '.join('"{}={}"'.format(member, os.path.join(dest_dir, dest))
+                         for member, dest in members.items())))
+    remove_script(script_path)
+    run_check('echo {} > {}'.format(checksum, marker_path))
+
+
 @task
 @log_call
 def jqwidgets_install():
     if env.get('jqwidgets_zip_archive_path'):
-        # if not localhost copy archive to a remote /tmp
-        if env.host != 'localhost':
-            put(env.jqwidgets_zip_archive_path, '/tmp')
-            env.jqwidgets_zip_archive_path = os.path.join(
-                '/tmp', os.path.basename(env.jqwidgets_zip_archive_path))
-        # unzip
-        run('unzip {zip_file_path} "jqwidgets/*" -d {dest_dir}'.format(
-            zip_file_path=env.jqwidgets_zip_archive_path,
-            dest_dir=os.path.join(STATICFILES_DIR, 'vendor')))
+        install_static_archive(
+            env.jqwidgets_zip_archive_path,
+            os.path.join(STATICFILES_DIR, 'vendor', 'jqwidgets'),
+            {'jqwidgets/': ''})
     else:
         print(red('No "jqwidgets_zip_archive_path" fabricrc setting specified, skip.'))
         print(yellow('WARNING: install that dependence separately. See project documentation.'))
@@ -1154,41 +2653,73 @@ def jqwidgets_install():
 @log_call
 def theme_install():
     if env.get('theme_zip_archive_path'):
-        # if not localhost copy archive to a remote /tmp
-        if env.host != 'localhost':
-            put(env.theme_zip_archive_path, '/tmp')
-            env.theme_zip_archive_path = os.path.join(
-                '/tmp', os.path.basename(env.theme_zip_archive_path))
-        # create destination directory
-        tmp_dir = '/tmp/theme'
-        dest_dir = os.path.join(STATICFILES_DIR, 'theme')
-        run('mkdir -p {}'.format(dest_dir))
-        sources_path = 'Package-HTML/HTML'
-        container = os.path.join(tmp_dir, sources_path)
-        # unpack and place in static dir these folders:
-        required_sources = ['js', 'css', 'images']
-        for source in required_sources:
-            run('unzip {zip_file_path} "{source}" -d {tmp_dir}'.format(
-                zip_file_path=env.theme_zip_archive_path,
-                source=os.path.join(sources_path, source, '*'), # e.g. Package-HTML/HTML/js/*
-                tmp_dir=tmp_dir))                               # e.g. /tmp/theme
-            run('cp -r {_from} {_to}'.format(
-                _from=os.path.join(container, source),          # e.g. /tmp/theme/Package-HTML/HTML/js
-                _to=dest_dir                                    # e.g. staticfiles/theme
-            ))
-        # unpack style.css and place it in theme/css static folder
-        run('unzip -j {zip_file_path} "{source}" -d {dest_dir}'.format(
-           zip_file_path=env.theme_zip_archive_path,
-           source=os.path.join(sources_path, 'style.css'),
-           dest_dir=os.path.join(dest_dir, 'css')))
-        sudo('rm -r {}'.format(tmp_dir))
+        # unpack and place in static dir js, css and images folders
+        # and style.css into theme/css static folder
+        sources_path = 'Package-HTML/HTML/'
+        members = OrderedDict(
+            (sources_path + source + '/', source) for source in ('js', 'css', 'images'))
+        members[sources_path + 'style.css'] = 'css/style.css'
+        install_static_archive(env.theme_zip_archive_path,
+                               os.path.join(STATICFILES_DIR, 'theme'),
+                               members)
     else:
         print(red('No "theme_zip_archive_path" fabricrc setting specified, skip.'))
         print(yellow('WARNING: install that dependence separately. See project documentation.'))
 
 
+def read_checksums(checksums_filename):
+    """
+    Read pinned sha256 checksums (`sha256sum` output format) from given custom and base config dirs.
+    """
+    checksums = {}
+    for config_dir in (env.base_config_dir, env.config_dir):
+        path = os.path.join(config_dir, checksums_filename)
+        if not os.path.exists(path):
+            continue
+        with open(path) as checksums_file:
+            for line in checksums_file:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                checksum, file_name = line.split(None, 1)
+                checksums[file_name.lstrip('*')] = checksum.lower()
+    return checksums
+
+
+def get_remote_checksum(path):
+    """
+    Calculate sha256 checksum of a remote file, None if it doesn't exist.
+    """
+    ret = run('sha256sum {} 2>/dev/null'.format(path), warn_only=True)
+    return ret.split()[0].lower() if ret.succeeded and ret.strip() else None
+
+
+def get_remote_checksums(dir_path, file_names, use_sudo=False):
+    """
+    Calculate sha256 checksums of remote files in a single call.
+    """
+    with cd(dir_path):
+        ret = run_check('sha256sum {}'.format(' '.join(file_names)), use_sudo=use_sudo)
+    checksums = {}
+    for line in ret.splitlines():
+        tokens = line.split()
+        if len(tokens) == 2:
+            checksums[tokens[1].lstrip('*')] = tokens[0].lower()
+    return checksums
+
+
 @task
-def stanford_install():
+@log_call
+def stanford_install(jobs=None, allow_unpinned=False):
+    """
+    Download, verify and unpack Stanford NLP archives.
+    Archives are downloaded concurrently and resumed if interrupted;
+    ones already unpacked with a matching checksum are skipped.
+    Archives without a pinned checksum in stanford-checksums.txt are refused,
+    unless stanford_install:allow_unpinned=1, which pins their checksums in the config dir
+    stanford-checksums.txt, so later installs and other hosts are verified against them.
+    """
+    jobs = int(jobs or env.download_jobs)
     with virtualenv():
         result = run('pip show lexnlp', warn_only=True)
         if result == '':
@@ -1198,19 +2729,62 @@ def stanford_install():
 
     lexnlp_location = '/usr'
     libs_path = os.path.join(lexnlp_location, 'lexnlp', 'libs')
-    mkdir(libs_path, use_sudo=True)
-
-    stanford_version = "2017-06-09"
-    stanford_path = os.path.join(libs_path, "stanford_nlp")
-    stanford_urls = [
-        'https://nlp.stanford.edu/software/stanford-corenlp-full-{}.zip',
-        'https://nlp.stanford.edu/software/stanford-parser-full-{}.zip',
-        'https://nlp.stanford.edu/software/stanford-english-corenlp-{}-models.jar',
-        'https://nlp.stanford.edu/software/stanford-postagger-full-{}.zip',
-        'https://nlp.stanford.edu/software/stanford-ner-{}.zip',
-    ]
-    for url in stanford_urls:
-        url = url.format(stanford_version)
-        run('wget --continue -O tmp.zip "{}"'.format(url))
-        run('unzip tmp.zip -d {}'.format(stanford_path))
-        run('rm -f tmp.zip')
+    stanford_path = os.path.join(libs_path, 'stanford_nlp')
+    download_path = os.path.join(libs_path, 'downloads')
+    mkdir(stanford_path, use_sudo=True)
+    mkdir(download_path, use_sudo=True)
+
+    urls = OrderedDict()
+    for url in STANFORD_URLS:
+        url = url.format(STANFORD_VERSION)
+        urls[os.path.basename(url)] = url
+    pinned = read_checksums('stanford-checksums.txt')
+
+    # each unpacked archive leaves a ".<archive>.sha256" marker with its checksum
+    with cd(stanford_path):
+        ret = run_check('for name in {}; do echo "$name $(cat .$name.sha256 2>/dev/null)"; done'.format(
+            ' '.join(urls)))
+    installed = dict(line.split() for line in ret.splitlines() if len(line.split()) == 2)
+    pending = [name for name in urls
+               if name not in installed or
+               (name in pinned and installed[name] != pinned[name])]
+    if not pending:
+        print(green('Stanford NLP archives are up to date, skip.'))
+        return
+    unpinned = [name for name in pending if name not in pinned]
+    if unpinned and not allow_unpinned:
+        raise RuntimeError('No pinned checksums for {} in stanford-checksums.txt, '
+                           'pin them or use allow_unpinned=1.'.format(', '.join(unpinned)))
+
+    # download concurrently into distinct files, resuming partial downloads
+    with cd(download_path):
+        run_check('printf "%s\\n" {urls} | xargs -n 1 -P {jobs} wget --continue -q'.format(
+            urls=' '.join('"{}"'.format(urls[name]) for name in pending),
+            jobs=jobs))
+
+    # verify
+    checksums = get_remote_checksums(download_path, pending)
+    unpinned_path = os.path.join(env.config_dir, 'stanford-checksums.txt')
+    for name in pending:
+        if name not in pinned:
+            print(yellow('WARNING: installing unpinned {}: {}, pinned in {}'.format(
+                name, checksums[name], unpinned_path)))
+            with open(unpinned_path, 'a') as f:
+                f.write('{}  {}\n'.format(checksums[name], name))
+        elif checksums[name] != pinned[name]:
+            run('rm -f {}'.format(os.path.join(download_path, name)))
+            raise RuntimeError('Checksum mismatch for {}: expected {}, got {}.'.format(
+                name, pinned[name], checksums[name]))
+
+    # unpack concurrently, then record markers and remove archives
+    with cd(download_path):
+        run_check('printf "%s\\n" {names} | xargs -P {jobs} -I{{}} unzip -q -o {{}} -d {dest}'.format(
+            names=' '.join(pending),
+            jobs=jobs,
+            dest=stanford_path))
+        run_check(' && '.join(
+            'echo {checksum} > {marker} && rm -f {name}'.format(
+                checksum=checksums[name],
+                marker=os.path.join(stanford_path, '.{}.sha256'.format(name)),
+                name=name)
+            for name in pending))
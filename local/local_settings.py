@@ -1,3 +1,4 @@
+import os
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'your-secret-key'
@@ -50,3 +51,43 @@ INTERNAL_IPS = (
     '127.0.0.1',
     'localhost'
 )
+
+# levels of LOG_FILE_PATH and DB_LOG_FILE_PATH handlers and their loggers, set after LOGGING is applied
+DJANGO_LOG_LEVEL = '%(django_log_level)s'
+DB_LOG_LEVEL = '%(db_log_level)s'
+LOGGING_CONFIG = 'local_settings.configure_logging'
+
+
+def configure_logging(logging_settings):
+    import logging
+    import logging.config
+    from django.conf import settings
+    logging.config.dictConfig(logging_settings)
+    levels = {os.path.abspath(settings.LOG_FILE_PATH): DJANGO_LOG_LEVEL,
+              os.path.abspath(settings.DB_LOG_FILE_PATH): DB_LOG_LEVEL}
+    loggers = [logging.getLogger()] + [logging.getLogger(name) for name in logging.root.manager.loggerDict]
+    for logger in loggers:
+        for handler in logger.handlers:
+            level = levels.get(getattr(handler, 'baseFilename', None))
+            if level:
+                handler.setLevel(level)
+                logger.setLevel(level)
+
+# celery results: redis backend with expiry instead of unbounded django-db (postgres) results,
+# ignore results of tasks by default unless they set ignore_result=False
+CELERY_RESULT_BACKEND = '%(celery_result_backend)s'
+CELERY_RESULT_EXPIRES = %(celery_result_expires)s
+CELERY_TASK_IGNORE_RESULT = %(celery_ignore_result)s
+CELERY_WORKER_PREFETCH_MULTIPLIER = %(celery_prefetch_multiplier)s
+
+# large uploads are written to a temp dir on a fast volume
+FILE_UPLOAD_TEMP_DIR = '%(upload_temp_dir)s/django'
+
+# protected documents are sent by nginx via X-Accel-Redirect to PROTECTED_DOCUMENTS_URL
+# + path relative to PROTECTED_DOCUMENTS_ROOT, see nginx.conf
+PROTECTED_DOCUMENTS_URL = '%(protected_documents_url)s'
+PROTECTED_DOCUMENTS_ROOT = '%(protected_documents_root)s'
+
+# shared pre-extracted nltk data, see nltk_download fabric task
+NLTK_DATA = '%(nltk_data_dir)s'
+os.environ.setdefault('NLTK_DATA', NLTK_DATA)
@@ -0,0 +1,11 @@
+# Shared by http_benchmark.py and ingestion_benchmark.py, uploaded next to them
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return None
+    index = max(0, int(round(percent / 100.0 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
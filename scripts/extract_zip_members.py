@@ -0,0 +1,46 @@
+# Imports
+import os
+import shutil
+import sys
+import zipfile
+
+USAGE = "Usage: extract_zip_members.py <zip file> <member prefix>=<destination> [...]"
+
+
+def get_destination(member_name, mapping):
+    """
+    Return destination path of an archive member or None if it is not required.
+    Prefixes ending with "/" map folders, other prefixes map single files.
+    """
+    for member_prefix, destination in mapping:
+        if member_prefix.endswith("/"):
+            if member_name.startswith(member_prefix):
+                return os.path.join(destination, member_name[len(member_prefix):])
+        elif member_name == member_prefix:
+            return destination
+    return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit(USAGE)
+
+    # Longest prefixes first, so nested folders can be mapped separately
+    mapping = sorted((arg.split("=", 1) for arg in sys.argv[2:]),
+                     key=lambda item: len(item[0]), reverse=True)
+
+    # Read archive index once and stream required members to their destinations
+    extracted = 0
+    with zipfile.ZipFile(sys.argv[1]) as zip_file:
+        for member in zip_file.infolist():
+            if member.filename.endswith("/"):
+                continue
+            destination = get_destination(member.filename, mapping)
+            if destination is None:
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with zip_file.open(member) as source, open(destination, "wb") as target:
+                shutil.copyfileobj(source, target)
+            extracted += 1
+
+    print("Extracted {} files".format(extracted))
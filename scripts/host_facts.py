@@ -0,0 +1,94 @@
+# Imports
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+
+USAGE = "Usage: host_facts.py <virtualenv python> <base dir>"
+
+
+def get_output(args):
+    """
+    Return command output lines, empty list if command is not available or fails.
+    """
+    try:
+        output = subprocess.check_output(args, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    return output.decode("utf-8", "replace").splitlines()
+
+
+def get_os_release():
+    os_release = {}
+    if os.path.exists("/etc/os-release"):
+        with open("/etc/os-release") as f:
+            for line in f:
+                if "=" in line:
+                    key, value = line.strip().split("=", 1)
+                    os_release[key.lower()] = value.strip('"')
+    return os_release
+
+
+def get_memory():
+    """
+    Return /proc/meminfo values in MB.
+    """
+    memory = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in ("MemTotal", "MemAvailable", "SwapTotal"):
+                memory[key.lower()] = int(value.split()[0]) // 1024
+    return memory
+
+
+def get_disk(path):
+    """
+    Return disk usage of the nearest existing path in MB.
+    """
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    usage = shutil.disk_usage(path)
+    return {"path": path,
+            "total": usage.total // 1024 ** 2,
+            "free": usage.free // 1024 ** 2}
+
+
+def get_init():
+    try:
+        return os.path.basename(os.path.realpath("/proc/1/exe"))
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(USAGE)
+    python_bin, base_dir = sys.argv[1:]
+
+    os_release = get_os_release()
+    units = {}
+    for line in get_output(["systemctl", "list-units", "--type=service", "--all",
+                            "--no-legend", "--plain"]):
+        tokens = line.split()
+        if len(tokens) >= 3:
+            units[tokens[0]] = tokens[2]
+
+    facts = {
+        "os": {"id": os_release.get("id"),
+               "version": os_release.get("version_id"),
+               "name": os_release.get("pretty_name")},
+        "kernel": platform.release(),
+        "init": get_init(),
+        "reboot_required": os.path.exists("/var/run/reboot-required"),
+        "cpu_count": os.cpu_count(),
+        "memory": get_memory(),
+        "disk": get_disk(base_dir),
+        "apt": dict(line.split(" ", 1) for line in get_output(
+            ["dpkg-query", "-W", "-f", "${Package} ${Version}\n"]) if " " in line),
+        "pip": get_output([python_bin, "-m", "pip", "freeze"]) if os.path.exists(python_bin) else [],
+        "units": units,
+    }
+    print(json.dumps(facts, sort_keys=True))
@@ -0,0 +1,228 @@
+# Imports
+import argparse
+import datetime
+import hashlib
+import http.cookiejar
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from benchmark_stats import percentile
+
+CSRF_INPUT_RE = re.compile(r'name=["\']csrfmiddlewaretoken["\']\s+value=["\']([^"\']+)')
+
+
+def get_stats(latencies, errors, duration):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {"requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else None,
+            "throughput": round(count / duration, 2),
+            "latency_ms": {"p50": percentile(latencies, 50),
+                           "p95": percentile(latencies, 95),
+                           "p99": percentile(latencies, 99),
+                           "max": latencies[-1] if latencies else None}}
+
+
+def get_file_checksum(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class Client:
+    """
+    HTTP client with its own session cookies, one per benchmark thread.
+    """
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, path, data=None, headers=None):
+        """
+        Return (status, body); HTTP errors are returned as statuses,
+        connection errors and timeouts as None status.
+        """
+        url = self.base_url + path
+        if data is not None:
+            data = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(url, data=data, headers=headers or {})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, b""
+        except (urllib.error.URLError, OSError):
+            return None, b""
+
+    def login(self, path, username, password):
+        """
+        Login through django form with CSRF token.
+        """
+        status, body = self.request(path)
+        if status is None:
+            return False
+        match = CSRF_INPUT_RE.search(body.decode("utf-8", "replace"))
+        data = {"login": username, "username": username, "password": password}
+        if match:
+            data["csrfmiddlewaretoken"] = match.group(1)
+        status, _ = self.request(path, data=data, headers={"Referer": self.base_url + path})
+        return status is not None and status < 400
+
+
+def weighted_index(rnd, weights):
+    point = rnd.uniform(0, sum(weights))
+    for index, weight in enumerate(weights):
+        point -= weight
+        if point <= 0:
+            return index
+    return len(weights) - 1
+
+
+def run_level(args, mix, concurrency):
+    """
+    Run request mix with given number of concurrent clients for args.duration seconds.
+    """
+    results = {item["name"]: {"latencies": [], "errors": 0} for item in mix}
+    if args.username:
+        results["session_login"] = {"latencies": [], "errors": 0}
+    lock = threading.Lock()
+    stop_at = time.time() + args.duration
+
+    def worker(number):
+        rnd = random.Random(args.seed + number)
+        client = Client(args.url, args.timeout)
+        if args.username:
+            start_time = time.time()
+            try:
+                failed = not client.login(args.login_path, args.username, args.password)
+            except Exception:
+                failed = True
+            with lock:
+                results["session_login"]["latencies"].append(round((time.time() - start_time) * 1000, 2))
+                results["session_login"]["errors"] += int(failed)
+        weights = [item.get("weight", 1) for item in mix]
+        while time.time() < stop_at:
+            item = mix[weighted_index(rnd, weights)]
+            start_time = time.time()
+            try:
+                status, _ = client.request(item["path"], data=item.get("data"))
+                failed = status is None or status >= 400
+            except Exception:
+                failed = True
+            latency = round((time.time() - start_time) * 1000, 2)
+            with lock:
+                results[item["name"]]["latencies"].append(latency)
+                results[item["name"]]["errors"] += int(failed)
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start_time
+
+    level = get_stats([latency for result in results.values() for latency in result["latencies"]],
+                      sum(result["errors"] for result in results.values()),
+                      duration)
+    level["concurrency"] = concurrency
+    level["duration"] = round(duration, 2)
+    level["by_request"] = {name: get_stats(result["latencies"], result["errors"], duration)
+                           for name, result in results.items()}
+    return level
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in app: answers any request after a short delay.
+    """
+    delay = 0.005
+
+    def respond(self):
+        time.sleep(self.delay)
+        body = b'<input type="hidden" name="csrfmiddlewaretoken" value="standin">'
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.respond()
+
+    def log_message(self, *args):
+        pass
+
+
+class StandinServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_standin():
+    server = StandinServer(("127.0.0.1", 0), StandinHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP load benchmark of the deployed stack.")
+    parser.add_argument("--url", default="http://127.0.0.1")
+    parser.add_argument("--mix", required=True, help="JSON file with request mix")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma separated levels")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per level")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--login-path", default="/accounts/login/")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--config-file", action="append", default=[],
+                        help="config file to attach checksum of, e.g. uwsgi.ini")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--standin", action="store_true", help="benchmark a local stand-in app")
+    args = parser.parse_args()
+
+    with open(args.mix) as f:
+        mix = json.load(f)
+
+    server = None
+    if args.standin:
+        server, args.url = start_standin()
+
+    report = {"started": datetime.datetime.utcnow().isoformat(),
+              "url": args.url,
+              "mix": mix,
+              "config": {os.path.basename(path): get_file_checksum(path) for path in args.config_file},
+              "levels": []}
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        level = run_level(args, mix, concurrency)
+        report["levels"].append(level)
+        print("concurrency {concurrency:>4}: {throughput:>8} req/s, p50 {p50} ms, p95 {p95} ms, "
+              "p99 {p99} ms, errors {error_rate}".format(
+                  concurrency=concurrency, throughput=level["throughput"],
+                  error_rate=level["error_rate"], **level["latency_ms"]))
+
+    if server:
+        server.shutdown()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Results: {}".format(args.output))
@@ -1,6 +1,12 @@
 # Imports
+import argparse
 import csv
-import pkg_resources
+import email.parser
+import json
+import os
+import re
+import sys
+import sysconfig
 
 OUTPUT_KEYS = ["Name",
                "Version",
@@ -8,37 +14,158 @@ OUTPUT_KEYS = ["Name",
                "License",
                "Author",
                "Author-email",
-               "Home-page"]
+               "Home-page",
+               "Requirement",
+               "Size"]
+
+METADATA_FILES = ("METADATA", "PKG-INFO")
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "identify_python_licenses.json")
+
+
+def normalize_name(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_requirement_names(line):
+    """
+    Return candidate distribution names for a requirement line,
+    including URL/VCS requirements, e.g.
+    https://github.com/LexPredict/lexpredict-lexnlp/archive/master.zip -> lexpredict-lexnlp, lexnlp
+    """
+    if "#egg=" in line:
+        return [normalize_name(line.split("#egg=", 1)[1].split("&")[0])]
+    if "://" not in line:
+        return [normalize_name(re.split(r"[\s\[<>=!~;]", line, 1)[0])]
+    path = [part for part in line.split("://", 1)[1].split("/") if part]
+    if "archive" in path:
+        repository = path[path.index("archive") - 1]
+    else:
+        repository = re.sub(r"(\.git|\.zip|\.tar\.gz)$", "", path[-1].split("@")[0])
+    repository = normalize_name(repository)
+    parts = repository.split("-")
+    return [repository] + ["-".join(parts[i:]) for i in range(1, len(parts))]
+
+
+def get_dist_size(dist_path, site_packages):
+    """
+    Installed size in bytes, from RECORD sizes or listed files.
+    """
+    size = 0
+    record_path = os.path.join(dist_path, "RECORD")
+    files_path = os.path.join(dist_path, "installed-files.txt")
+    if os.path.exists(record_path):
+        with open(record_path, newline="") as record_file:
+            for row in csv.reader(record_file):
+                if len(row) >= 3 and row[2]:
+                    size += int(row[2])
+                elif row:
+                    path = os.path.join(site_packages, row[0])
+                    size += os.path.getsize(path) if os.path.isfile(path) else 0
+    elif os.path.exists(files_path):
+        with open(files_path) as files_file:
+            for line in files_file:
+                path = os.path.normpath(os.path.join(dist_path, line.strip()))
+                size += os.path.getsize(path) if os.path.isfile(path) else 0
+    return size
+
+
+def read_dist(dist_path, site_packages):
+    """
+    Read package row from dist-info/egg-info metadata.
+    """
+    row = dict((key, None) for key in OUTPUT_KEYS)
+    for file_name in METADATA_FILES:
+        path = os.path.join(dist_path, file_name)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8", errors="replace") as metadata_file:
+                metadata = email.parser.Parser().parse(metadata_file, headersonly=True)
+            for key in OUTPUT_KEYS:
+                if metadata.get(key) not in (None, "UNKNOWN"):
+                    row[key] = metadata.get(key).strip()
+            break
+    row["Size"] = get_dist_size(dist_path, site_packages)
+    direct_url_path = os.path.join(dist_path, "direct_url.json")
+    if os.path.exists(direct_url_path):
+        with open(direct_url_path) as direct_url_file:
+            row["direct_url"] = json.load(direct_url_file).get("url")
+    return row
+
+
+def scan_site_packages(site_packages_dirs, cache):
+    """
+    Read all installed distributions in a single pass,
+    reusing cached rows for dist-info dirs with unchanged mtime.
+    """
+    rows = {}
+    for site_packages in site_packages_dirs:
+        if not os.path.isdir(site_packages):
+            continue
+        for entry in os.scandir(site_packages):
+            if not entry.name.endswith((".dist-info", ".egg-info")) or not entry.is_dir():
+                continue
+            mtime = entry.stat().st_mtime
+            cached = cache.get(entry.path)
+            if not cached or cached["mtime"] != mtime:
+                cached = cache[entry.path] = {"mtime": mtime, "row": read_dist(entry.path, site_packages)}
+            row = cached["row"]
+            if row["Name"]:
+                rows[normalize_name(row["Name"])] = dict(row)
+    return rows
+
 
 if __name__ == "__main__":
-    # Setup CSV output
-    csv_file = open('licenses.csv', 'w')
-    csv_writer = csv.writer(csv_file)
-    csv_writer.writerow([key for key in OUTPUT_KEYS])
-
-    # Open file and read lines
-    with open("base/python-requirements.txt", "r") as input_file:
-        # Iterate through all lines
-        for line in input_file.readlines():
-            # Setup package dictionary
-            package_row =  dict([(key, None) for key in OUTPUT_KEYS])
-            
-            # Tokenize package name
-            package_row["Name"] = line.split("=")[0].strip()
-            try:
-                package_info = pkg_resources.get_distribution(package_row["Name"])
-                package_metadata = package_info._get_metadata(package_info.PKG_INFO)
-
-                for metadata_line in package_metadata:
-                    if ":" in metadata_line:
-                        key, value = metadata_line.split(":", 1)
-                        if key in OUTPUT_KEYS:
-                            package_row[key] = value.strip()
-            except Exception as e:
-                print((package_row["name"], e))
-                pass
-
-            csv_writer.writerow([package_row[key] for key in OUTPUT_KEYS])
-
-    # CLose CSV file
-    csv_file.close()
+    parser = argparse.ArgumentParser(description="Audit licenses and sizes of installed python packages.")
+    parser.add_argument("--requirements", default="base/python-requirements.txt")
+    parser.add_argument("--site-packages", action="append",
+                        help="site-packages dir, by default of the running (virtualenv) python")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--output")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    # Load metadata cache
+    cache = {}
+    if os.path.exists(args.cache):
+        with open(args.cache) as cache_file:
+            cache = json.load(cache_file)
+
+    # Scan installed distributions once
+    site_packages_dirs = args.site_packages or sorted(
+        set(sysconfig.get_paths()[key] for key in ("purelib", "platlib")))
+    installed = scan_site_packages(site_packages_dirs, cache)
+    direct_urls = dict((row.get("direct_url"), name) for name, row in installed.items() if row.get("direct_url"))
+
+    # Match requirements
+    with open(args.requirements, "r") as input_file:
+        for line in input_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name = direct_urls.get(line)
+            if name is None:
+                name = next((candidate for candidate in get_requirement_names(line) if candidate in installed),
+                            None)
+            if name is None:
+                print("Not installed: {}".format(line), file=sys.stderr)
+                installed[line] = dict((key, None) for key in OUTPUT_KEYS)
+                installed[line]["Name"] = get_requirement_names(line)[0]
+                name = line
+            installed[name]["Requirement"] = line
+
+    # Save metadata cache
+    os.makedirs(os.path.dirname(os.path.abspath(args.cache)), exist_ok=True)
+    with open(args.cache, "w") as cache_file:
+        json.dump(cache, cache_file)
+
+    # Output CSV or JSON
+    rows = [dict((key, row.get(key)) for key in OUTPUT_KEYS)
+            for _, row in sorted(installed.items())]
+    output_file = open(args.output or "licenses.{}".format(args.format), "w", newline="")
+    if args.format == "json":
+        json.dump(rows, output_file, indent=2)
+    else:
+        csv_writer = csv.writer(output_file)
+        csv_writer.writerow(OUTPUT_KEYS)
+        for row in rows:
+            csv_writer.writerow([row[key] for key in OUTPUT_KEYS])
+    output_file.close()
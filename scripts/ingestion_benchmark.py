@@ -0,0 +1,148 @@
+# Imports
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from celery.app.utils import find_app
+
+from benchmark_stats import percentile
+
+
+def get_latency_stats(values):
+    values = sorted(values)
+    return {"count": len(values),
+            "mean": round(sum(values) / len(values), 3) if values else None,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": values[-1] if values else None}
+
+
+class TaskEventsCollector:
+    """
+    Collect task events of the cluster, tracking when processing has settled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.tasks = defaultdict(dict)
+        self.last_event_at = time.time()
+        self.lock = threading.Lock()
+
+    def on_event(self, event):
+        if not event["type"].startswith("task-"):
+            return
+        with self.lock:
+            task = self.tasks[event["uuid"]]
+            task[event["type"]] = event
+            for key in ("name", "hostname", "root_id"):
+                if event.get(key) and not task.get(key):
+                    task[key] = event[key]
+            self.last_event_at = time.time()
+
+    def capture(self):
+        with self.app.connection() as connection:
+            receiver = self.app.events.Receiver(connection, handlers={"*": self.on_event})
+            receiver.capture(limit=None, timeout=None, wakeup=True)
+
+    def is_settled(self, idle):
+        """
+        All seen tasks are finished and no events arrived for idle seconds.
+        """
+        with self.lock:
+            if time.time() - self.last_event_at < idle:
+                return False
+            return all(set(task) & {"task-succeeded", "task-failed", "task-revoked"}
+                       for task in self.tasks.values())
+
+
+def get_report(tasks, root_id, sent_at, documents):
+    """
+    Per-stage (task name) and per-worker latencies of tasks of the benchmark run.
+    Queue wait is time from sent (or received) to started, execution is task runtime.
+    """
+    tasks = {uuid: task for uuid, task in tasks.items()
+             if uuid == root_id or task.get("root_id") in (None, root_id)}
+    by_name = defaultdict(lambda: {"wait": [], "execution": [], "failed": 0})
+    by_worker = defaultdict(lambda: {"wait": [], "execution": [], "failed": 0})
+    finished_at = sent_at
+    for uuid, task in tasks.items():
+        started = task.get("task-started")
+        queued = task.get("task-sent") or task.get("task-received")
+        succeeded = task.get("task-succeeded")
+        worker = (task.get("hostname") or "unknown").split("@")[0]
+        for stats in (by_name[task.get("name") or "unknown"], by_worker[worker]):
+            if uuid == root_id and started:
+                stats["wait"].append(round(started["timestamp"] - sent_at, 3))
+            elif queued and started:
+                stats["wait"].append(round(started["timestamp"] - queued["timestamp"], 3))
+            if succeeded:
+                stats["execution"].append(round(succeeded.get("runtime") or 0, 3))
+            if "task-failed" in task:
+                stats["failed"] += 1
+        for event_type in ("task-succeeded", "task-failed"):
+            if event_type in task:
+                finished_at = max(finished_at, task[event_type]["timestamp"])
+
+    def summary(groups):
+        return {key: {"wait": get_latency_stats(stats["wait"]),
+                      "execution": get_latency_stats(stats["execution"]),
+                      "failed": stats["failed"]}
+                for key, stats in sorted(groups.items())}
+
+    duration = finished_at - sent_at
+    return {"documents": documents,
+            "tasks": len(tasks),
+            "duration": round(duration, 2),
+            "documents_per_second": round(documents / duration, 3) if duration > 0 else None,
+            "stages": summary(by_name),
+            "workers": summary(by_worker)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Document ingestion throughput benchmark.")
+    parser.add_argument("--celery-app", default="apps")
+    parser.add_argument("--task", required=True, help="celery task name to trigger processing")
+    parser.add_argument("--kwargs", default="{}", help="task kwargs JSON")
+    parser.add_argument("--documents", type=int, required=True, help="number of corpus documents")
+    parser.add_argument("--idle", type=float, default=30,
+                        help="seconds without task events to treat processing as finished")
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--output", default="ingestion-benchmark.json")
+    args = parser.parse_args()
+
+    # Run from the project dir, like celery -A
+    sys.path.insert(0, os.getcwd())
+    app = find_app(args.celery_app)
+
+    # Workers don't send task events unless enabled
+    app.control.enable_events()
+    collector = TaskEventsCollector(app)
+    threading.Thread(target=collector.capture, daemon=True).start()
+    time.sleep(1)
+
+    sent_at = time.time()
+    result = app.send_task(args.task, kwargs=json.loads(args.kwargs))
+    print("Sent {} {}".format(args.task, result.id))
+    while time.time() - sent_at < args.timeout and not collector.is_settled(args.idle):
+        time.sleep(1)
+    timed_out = time.time() - sent_at >= args.timeout
+    app.control.disable_events()
+
+    with collector.lock:
+        report = get_report(dict(collector.tasks), result.id, sent_at, args.documents)
+    report.update({"started": datetime.datetime.utcfromtimestamp(sent_at).isoformat(),
+                   "task": args.task,
+                   "kwargs": json.loads(args.kwargs),
+                   "timed_out": timed_out})
+    print("{documents} documents, {tasks} tasks in {duration}s: {documents_per_second} docs/s".format(**report))
+    for worker, stats in report["workers"].items():
+        print("{:>20}: wait p50 {} s, execution p50 {} s".format(
+            worker, stats["wait"]["p50"], stats["execution"]["p50"]))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Results: {}".format(args.output))
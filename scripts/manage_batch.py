@@ -0,0 +1,51 @@
+# Imports
+import glob
+import os
+import shlex
+import sys
+import time
+
+USAGE = "Usage: manage_batch.py <management command with args> [...]"
+
+
+def expand_args(command):
+    """
+    Split command into argv, expanding shell-like globs, e.g. fixtures/common/*.json
+    """
+    argv = []
+    for arg in shlex.split(command):
+        matches = sorted(glob.glob(arg)) if any(c in arg for c in "*?[") else None
+        argv.extend(matches or [arg])
+    return argv
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(USAGE)
+
+    # Run from the project dir, like manage.py
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+    # Boot Django and the app registry once for all the commands
+    start_time = time.time()
+    import django
+    from django.core.management import call_command
+    django.setup()
+    print("Django setup: {:.2f}s".format(time.time() - start_time))
+
+    timings = []
+    for command in sys.argv[1:]:
+        argv = expand_args(command)
+        print("$ manage.py {}".format(" ".join(argv)))
+        start_time = time.time()
+        try:
+            call_command(*argv)
+        except (Exception, SystemExit) as e:
+            print("Command failed: {} ({})".format(command, e))
+            sys.exit(1)
+        timings.append((command, time.time() - start_time))
+
+    # Print timing stats
+    for command, seconds in timings:
+        print("{:>8.2f}s  {}".format(seconds, command))
@@ -0,0 +1,243 @@
+# Imports
+import argparse
+import datetime
+import json
+import math
+import time
+
+import psycopg2
+
+STATEMENTS_SQL = """
+SELECT query, calls, {total_time} AS total_ms, {mean_time} AS mean_ms, rows
+FROM pg_stat_statements
+WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+ORDER BY {order} DESC
+LIMIT %s
+"""
+
+# Estimated row/key width from pg_stats, used to estimate bloat without reading relations
+TABLES_SQL = """
+SELECT c.oid::regclass::text, c.relpages, c.reltuples, pg_relation_size(c.oid),
+       s.n_live_tup, s.n_dead_tup, s.last_vacuum, s.last_autovacuum, s.last_analyze, s.last_autoanalyze,
+       (SELECT sum(st.avg_width) FROM pg_stats st
+        WHERE st.schemaname = s.schemaname AND st.tablename = s.relname)
+FROM pg_stat_user_tables s
+JOIN pg_class c ON c.oid = s.relid
+"""
+
+INDEXES_SQL = """
+SELECT c.oid::regclass::text, i.indrelid::regclass::text, quote_ident(c.relname),
+       c.relpages, c.reltuples, pg_relation_size(c.oid), s.idx_scan,
+       i.indisunique, con.conname IS NOT NULL, 0 = ANY(i.indkey), am.amname,
+       (SELECT sum(st.avg_width) FROM pg_attribute a
+        JOIN pg_stats st ON st.schemaname = s.schemaname AND st.tablename = s.relname AND st.attname = a.attname
+        WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey))
+FROM pg_stat_user_indexes s
+JOIN pg_index i ON i.indexrelid = s.indexrelid
+JOIN pg_class c ON c.oid = s.indexrelid
+JOIN pg_am am ON am.oid = c.relam
+LEFT JOIN pg_constraint con ON con.conindid = s.indexrelid
+"""
+
+BLOCK_SIZE = 8192
+PAGE_HEADER = 24
+BTREE_SPECIAL = 16
+BTREE_FILLFACTOR = 0.9
+
+
+def align(width):
+    return int(math.ceil(width / 8.0) * 8)
+
+
+def get_bloat(relpages, expected_pages):
+    """
+    Return estimated (bloat bytes, bloat ratio) of relation.
+    """
+    if not relpages or expected_pages is None:
+        return None, None
+    bloat_pages = max(0, relpages - expected_pages)
+    return bloat_pages * BLOCK_SIZE, round(bloat_pages / relpages, 3)
+
+
+def get_statements(cursor, top, version):
+    """
+    Top queries by total time, mean time and calls.
+    """
+    total_time, mean_time = ("total_exec_time", "mean_exec_time") if version >= 130000 \
+        else ("total_time", "mean_time")
+    statements = {}
+    for key, order in (("by_total_time", total_time), ("by_mean_time", mean_time), ("by_calls", "calls")):
+        cursor.execute(STATEMENTS_SQL.format(total_time=total_time, mean_time=mean_time, order=order), (top,))
+        statements[key] = [{"query": query,
+                            "calls": calls,
+                            "total_ms": round(total_ms, 2),
+                            "mean_ms": round(mean_ms, 2),
+                            "rows": rows}
+                           for query, calls, total_ms, mean_ms, rows in cursor.fetchall()]
+    return statements
+
+
+def get_tables(cursor):
+    tables = []
+    cursor.execute(TABLES_SQL)
+    for (name, relpages, reltuples, size, live, dead, last_vacuum, last_autovacuum,
+         last_analyze, last_autoanalyze, row_width) in cursor.fetchall():
+        expected_pages = None
+        if row_width is not None:
+            # heap tuple header and line pointer per row
+            row_size = 24 + align(row_width) + 4
+            expected_pages = int(math.ceil(reltuples * row_size / (BLOCK_SIZE - PAGE_HEADER)))
+        bloat_bytes, bloat_ratio = get_bloat(relpages, expected_pages)
+        tables.append({"table": name,
+                       "size": size,
+                       "live_tuples": live,
+                       "dead_tuples": dead,
+                       "dead_ratio": round(dead / (live + dead), 3) if live + dead else 0,
+                       "bloat_bytes": bloat_bytes,
+                       "bloat_ratio": bloat_ratio,
+                       "last_vacuum": str(last_vacuum or last_autovacuum or "") or None,
+                       "last_analyze": str(last_analyze or last_autoanalyze or "") or None})
+    return sorted(tables, key=lambda table: -(table["bloat_bytes"] or 0))
+
+
+def get_indexes(cursor):
+    indexes = []
+    cursor.execute(INDEXES_SQL)
+    for (name, table, relname, relpages, reltuples, size, scans, unique, constraint, expression,
+         method, key_width) in cursor.fetchall():
+        expected_pages = None
+        # btree estimate only, expression keys have no pg_stats width
+        if method == "btree" and key_width is not None and not expression:
+            # index tuple header and line pointer per key
+            key_size = 8 + align(key_width) + 4
+            usable = (BLOCK_SIZE - PAGE_HEADER - BTREE_SPECIAL) * BTREE_FILLFACTOR
+            expected_pages = int(math.ceil(reltuples * key_size / usable)) + 1
+        bloat_bytes, bloat_ratio = get_bloat(relpages, expected_pages)
+        indexes.append({"index": name,
+                        "name": relname,
+                        "table": table,
+                        "size": size,
+                        "scans": scans,
+                        "unique": unique,
+                        "constraint": constraint,
+                        "bloat_bytes": bloat_bytes,
+                        "bloat_ratio": bloat_ratio})
+    return sorted(indexes, key=lambda index: -(index["bloat_bytes"] or 0))
+
+
+def get_report(connection, top):
+    cursor = connection.cursor()
+    version = connection.server_version
+    cursor.execute("SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()")
+    stats_reset = cursor.fetchone()[0]
+    indexes = get_indexes(cursor)
+    report = {"created": datetime.datetime.utcnow().isoformat(),
+              "server_version": version,
+              "stats_reset": str(stats_reset) if stats_reset else None,
+              "tables": get_tables(cursor),
+              "indexes": indexes,
+              "unused_indexes": sorted([index for index in indexes
+                                        if not index["scans"] and not index["unique"]
+                                        and not index["constraint"]],
+                                       key=lambda index: -index["size"])}
+    try:
+        report["statements"] = get_statements(cursor, top, version)
+    except psycopg2.Error as e:
+        # extension not created or not in shared_preload_libraries
+        connection.rollback()
+        report["statements"] = None
+        print("No pg_stat_statements: {}".format(str(e).strip()))
+    return report
+
+
+def get_maintenance_plan(report, threshold, min_size, limit):
+    """
+    VACUUM (ANALYZE) and REINDEX of the worst bloated tables and indexes above threshold and min size.
+    """
+    tables = [table for table in report["tables"]
+              if table["size"] >= min_size
+              and max(table["bloat_ratio"] or 0, table["dead_ratio"]) >= threshold]
+    indexes = [index for index in report["indexes"]
+               if index["size"] >= min_size and (index["bloat_ratio"] or 0) >= threshold]
+    return ([{"action": "vacuum", "relation": table["table"], "size": table["size"]}
+             for table in tables[:limit]] +
+            [{"action": "reindex", "relation": index["index"], "name": index["name"],
+              "constraint": index["constraint"], "size": index["size"]}
+             for index in indexes[:limit]])
+
+
+def reindex_concurrently(cursor, version, item):
+    """
+    REINDEX CONCURRENTLY (postgres >= 12), otherwise build a copy concurrently and swap it in;
+    constraint indexes can't be swapped that way and are skipped on older servers.
+    """
+    if version >= 120000:
+        cursor.execute("REINDEX INDEX CONCURRENTLY {}".format(item["relation"]))
+        return
+    if item["constraint"]:
+        raise RuntimeError("constraint index requires postgres >= 12 for REINDEX CONCURRENTLY")
+    cursor.execute("SELECT pg_get_indexdef(%s::regclass)", (item["relation"],))
+    definition = cursor.fetchone()[0]
+    new_name = item["name"].strip('"')[:50] + "_reindex"
+    relation = item["relation"]
+    new_relation = relation[:len(relation) - len(item["name"])] + '"{}"'.format(new_name)
+    cursor.execute(definition.replace(" INDEX {} ON ".format(item["name"]),
+                                      ' INDEX CONCURRENTLY "{}" ON '.format(new_name), 1))
+    cursor.execute("DROP INDEX CONCURRENTLY {}".format(relation))
+    cursor.execute("ALTER INDEX {} RENAME TO {}".format(new_relation, item["name"]))
+
+
+def run_maintenance(connection, plan):
+    connection.autocommit = True
+    cursor = connection.cursor()
+    for item in plan:
+        start_time = time.time()
+        try:
+            if item["action"] == "vacuum":
+                cursor.execute("VACUUM (ANALYZE) {}".format(item["relation"]))
+            else:
+                reindex_concurrently(cursor, connection.server_version, item)
+            item["status"] = "done"
+        except (psycopg2.Error, RuntimeError) as e:
+            item["status"] = "failed"
+            item["error"] = str(e).strip()
+        item["seconds"] = round(time.time() - start_time, 2)
+        if item["status"] == "done":
+            cursor.execute("SELECT pg_relation_size(%s::regclass)", (item["relation"],))
+            item["size_after"] = cursor.fetchone()[0]
+        print("{action} {relation}: {status} in {seconds}s".format(**item))
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PostgreSQL query, bloat and index report and maintenance.")
+    parser.add_argument("command", choices=("report", "maintain"))
+    parser.add_argument("--dbname", required=True)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="5432")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=0.3, help="bloat/dead tuples ratio")
+    parser.add_argument("--min-size", type=int, default=10 * 1024 ** 2, help="bytes")
+    parser.add_argument("--limit", type=int, default=5, help="max tables and max indexes")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--output", default="postgres-report.json")
+    args = parser.parse_args()
+
+    # password from PGPASSWORD
+    connection = psycopg2.connect(dbname=args.dbname, host=args.host, port=args.port, user=args.user)
+    report = get_report(connection, args.top)
+    if args.command == "maintain":
+        plan = get_maintenance_plan(report, args.threshold, args.min_size, args.limit)
+        report = {"created": report["created"],
+                  "dry_run": args.dry_run,
+                  "threshold": args.threshold,
+                  "actions": plan if args.dry_run else run_maintenance(connection, plan)}
+        if args.dry_run:
+            for item in plan:
+                print("{action} {relation}: {size} bytes".format(**item))
+    connection.close()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Results: {}".format(args.output))
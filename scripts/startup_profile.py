@@ -0,0 +1,164 @@
+# Imports
+import argparse
+import importlib._bootstrap as importlib_bootstrap
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from warmup import request, wait_socket
+
+
+def parse_importtime(output):
+    """
+    Parse `python -X importtime` output (python >= 3.7).
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        imports.append({"module": name.strip(),
+                        "self_us": int(self_us),
+                        "cumulative_us": int(cumulative_us)})
+    return imports
+
+
+def trace_imports(target):
+    """
+    Measure imports for pythons without -X importtime by wrapping importlib's
+    _find_and_load, which both import statements and import_module call.
+    """
+    imports = []
+    stack = []
+    original_find_and_load = importlib_bootstrap._find_and_load
+
+    def timed_find_and_load(name, *args):
+        stack.append(0)
+        start_time = time.perf_counter()
+        try:
+            return original_find_and_load(name, *args)
+        finally:
+            cumulative = time.perf_counter() - start_time
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            imports.append({"module": name,
+                            "self_us": int((cumulative - children) * 1e6),
+                            "cumulative_us": int(cumulative * 1e6)})
+
+    importlib_bootstrap._find_and_load = timed_find_and_load
+    try:
+        import_target(target)
+    finally:
+        importlib_bootstrap._find_and_load = original_find_and_load
+    return imports
+
+
+def import_target(target):
+    """
+    Import module, or celery app with its task modules for "celery:<app>" targets.
+    """
+    if target.startswith("celery:"):
+        from celery.app.utils import find_app
+        app = find_app(target.split(":", 1)[1])
+        app.loader.import_default_modules()
+    else:
+        __import__(target)
+
+
+def profile_imports(target):
+    if sys.version_info >= (3, 7):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", __file__, "import", target],
+            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True)
+        imports = parse_importtime(process.stderr)
+    else:
+        imports = trace_imports(target)
+    total_us = max([item["cumulative_us"] for item in imports] or [0])
+    return {"target": target,
+            "total_seconds": round(total_us / 1e6, 3),
+            "by_cumulative": sorted(imports, key=lambda item: -item["cumulative_us"]),
+            "by_self": sorted(imports, key=lambda item: -item["self_us"])}
+
+
+def wait_workers_ready(address, host, url, workers, started_at, timeout):
+    """
+    Seconds from started_at until each uwsgi worker served its first request: as many
+    simultaneous requests through the socket as there are workers, a busy worker leaves
+    the next connection to another one, so each request is served by a different worker.
+    """
+    if not wait_socket(address, timeout):
+        return []
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers)
+
+    def worker():
+        barrier.wait()
+        status, seconds = request(address, host, url, timeout)
+        with lock:
+            results.append({"status": status,
+                            "request_seconds": seconds,
+                            "seconds": round(time.time() - started_at, 3)})
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(results, key=lambda result: result["seconds"])
+
+
+def wait_celery_ready(celery_app, nodes, timeout):
+    """
+    Return unix times when each celery node first answered ping.
+    """
+    from celery.app.utils import find_app
+    app = find_app(celery_app)
+    ready = {}
+    start_time = time.time()
+    while len(ready) < nodes and time.time() - start_time < timeout:
+        for reply in app.control.ping(timeout=0.5) or []:
+            for node in reply:
+                ready.setdefault(node, time.time())
+    return ready
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Django and celery cold start profiling.")
+    subparsers = parser.add_subparsers(dest="command")
+    parser_imports = subparsers.add_parser("imports", help="profile imports of targets")
+    parser_imports.add_argument("targets", nargs="+", help='module names or "celery:<app>"')
+    parser_import = subparsers.add_parser("import", help="import target, used with -X importtime")
+    parser_import.add_argument("target")
+    parser_workers = subparsers.add_parser("workers-ready", help="first request of each uwsgi worker")
+    parser_workers.add_argument("--socket", required=True, help="host:port or unix socket path")
+    parser_workers.add_argument("--host", default="localhost", help="Host header")
+    parser_workers.add_argument("--url", default="/")
+    parser_workers.add_argument("--workers", type=int, default=5, help="uwsgi processes")
+    parser_workers.add_argument("--started-at", type=float, required=True, help="unix time of restart")
+    parser_workers.add_argument("--timeout", type=float, default=300)
+    parser_celery = subparsers.add_parser("celery-ready", help="wait for celery nodes ping")
+    parser_celery.add_argument("celery_app")
+    parser_celery.add_argument("--nodes", type=int, default=1)
+    parser_celery.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    # Run from the project dir, like manage.py
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+    if args.command == "import":
+        import_target(args.target)
+    elif args.command == "imports":
+        print(json.dumps([profile_imports(target) for target in args.targets]))
+    elif args.command == "workers-ready":
+        print(json.dumps(wait_workers_ready(args.socket, args.host, args.url, args.workers,
+                                            args.started_at, args.timeout)))
+    elif args.command == "celery-ready":
+        print(json.dumps(wait_celery_ready(args.celery_app, args.nodes, args.timeout)))
+    else:
+        parser.print_help()
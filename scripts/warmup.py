@@ -0,0 +1,146 @@
+# Imports
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+
+def encode_uwsgi_vars(variables):
+    """
+    uwsgi protocol packet: header (modifier1, vars size, modifier2) and length-prefixed vars.
+    """
+    body = b"".join(struct.pack("<H", len(key)) + key + struct.pack("<H", len(value)) + value
+                    for key, value in ((key.encode(), value.encode()) for key, value in variables.items()))
+    return struct.pack("<BHB", 0, len(body), 0) + body
+
+
+def connect(address, timeout):
+    if address.startswith("/"):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(address)
+        return connection
+    host, port = address.rsplit(":", 1)
+    return socket.create_connection((host, int(port)), timeout=timeout)
+
+
+def wait_socket(address, timeout):
+    """
+    Wait until uwsgi accepts connections, return False on timeout.
+    """
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        try:
+            connect(address, 1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def request(address, host, url, timeout):
+    """
+    Send GET request straight to uwsgi socket, return (status, seconds).
+    """
+    path, _, query = url.partition("?")
+    variables = {"REQUEST_METHOD": "GET",
+                 "REQUEST_URI": url,
+                 "PATH_INFO": path,
+                 "QUERY_STRING": query,
+                 "SERVER_PROTOCOL": "HTTP/1.1",
+                 "SERVER_NAME": host,
+                 "SERVER_PORT": "80",
+                 "HTTP_HOST": host,
+                 "REMOTE_ADDR": "127.0.0.1"}
+    start_time = time.time()
+    try:
+        connection = connect(address, timeout)
+        connection.sendall(encode_uwsgi_vars(variables))
+        response = b""
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+        connection.close()
+        status = int(response.split(b" ", 2)[1]) if response.startswith(b"HTTP/") else 502
+    except (OSError, ValueError):
+        status = None
+    return status, round(time.time() - start_time, 3)
+
+
+def warmup_url(address, host, url, workers, timeout):
+    """
+    Send as many simultaneous requests as there are workers, so that each busy worker
+    leaves the next connection to another one and every worker serves the url.
+    """
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers)
+
+    def worker():
+        barrier.wait()
+        result = request(address, host, url, timeout)
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies = sorted(seconds for _, seconds in results)
+    return {"statuses": sorted(set(str(status) for status, _ in results)),
+            "ok": all(status is not None and status < 500 for status, _ in results),
+            "min": latencies[0],
+            "max": latencies[-1]}
+
+
+def prime_caches():
+    """
+    Connect each configured django cache backend with a set/get round trip.
+    """
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.core.cache import caches
+    primed = {}
+    for alias in settings.CACHES:
+        start_time = time.time()
+        try:
+            caches[alias].set("warmup", start_time, 60)
+            caches[alias].get("warmup")
+            primed[alias] = round(time.time() - start_time, 3)
+        except Exception as e:
+            primed[alias] = str(e)
+    return primed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm up uwsgi workers through the local socket.")
+    parser.add_argument("--socket", required=True, help="host:port or unix socket path")
+    parser.add_argument("--host", default="localhost", help="Host header")
+    parser.add_argument("--urls", required=True, help="paths separated by ;")
+    parser.add_argument("--workers", type=int, default=5, help="uwsgi processes")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--prime-cache", action="store_true", help="prime django cache backends")
+    args = parser.parse_args()
+
+    # Run from the project dir, like manage.py
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+    report = {"socket_ready": wait_socket(args.socket, args.timeout), "caches": None, "urls": {}}
+    if args.prime_cache:
+        report["caches"] = prime_caches()
+    urls = [url.strip() for url in args.urls.split(";") if url.strip()]
+    for url in urls if report["socket_ready"] else []:
+        report["urls"][url] = [warmup_url(args.socket, args.host, url, args.workers, args.timeout)
+                               for _ in range(args.rounds)]
+    report["ready"] = report["socket_ready"] and all(rounds[-1]["ok"] for rounds in report["urls"].values())
+    print(json.dumps(report, sort_keys=True))
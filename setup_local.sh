@@ -36,11 +36,7 @@ fab -c local/fabricrc upload_template_and_reload:uwsgi
 fab -c local/fabricrc upload_template_and_reload:settings
 fab -c local/fabricrc upload_template_and_reload:nginx
 
-fab -c local/fabricrc manage:force_migrate
-fab -c local/fabricrc manage:set_site
-fab -c local/fabricrc manage:collectstatic
-fab -c local/fabricrc manage:loadnewdata,fixtures/common/*.json
-fab -c local/fabricrc manage:loadnewdata,fixtures/private/*.json
+fab -c local/fabricrc manage_batch:force_migrate,set_site,"collectstatic --noinput","loadnewdata fixtures/common/*.json","loadnewdata fixtures/private/*.json"
 fab -c local/fabricrc create_superuser
 
 fab -c local/fabricrc nltk_download
@@ -37,11 +37,7 @@ fab -c remote/fabricrc upload_template_and_reload:uwsgi
 fab -c remote/fabricrc upload_template_and_reload:settings
 fab -c remote/fabricrc upload_template_and_reload:nginx
 
-fab -c remote/fabricrc manage:force_migrate
-fab -c remote/fabricrc manage:set_site
-fab -c remote/fabricrc manage:collectstatic
-fab -c remote/fabricrc manage:loadnewdata,fixtures/common/*.json
-fab -c remote/fabricrc manage:loadnewdata,fixtures/private/*.json
+fab -c remote/fabricrc manage_batch:force_migrate,set_site,"collectstatic --noinput","loadnewdata fixtures/common/*.json","loadnewdata fixtures/private/*.json"
 fab -c remote/fabricrc create_superuser
 
 fab -c remote/fabricrc nltk_download
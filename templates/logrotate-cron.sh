@@ -0,0 +1,3 @@
+#!/bin/sh
+# Managed by fabric logs_install task
+/usr/sbin/logrotate /etc/logrotate.d/%(templates_prefix)s
@@ -2,6 +2,7 @@
 
 cd %(project_dir)s
 source %(ve_bin)s/activate
+export NLTK_DATA=%(nltk_data_dir)s
 if [ $1 ]; then
     if [ $1 = "s" ]; then
         python manage.py shell